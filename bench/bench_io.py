@@ -0,0 +1,225 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+from wstr.io import Genotype, GenotypeMatrix, QFile
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "baselines.json")
+DELIMITER = dict(csv=",", txt="\t", tsv="\t")
+
+
+def generate_genotype(n_samples, n_loci, format="csv", missing=0.05, seed=0,
+                      prefix="S", loci_offset=0):
+    # Biallelic genotypes, each missing with probability `missing`
+    rand = random.Random(seed)
+    loci = ["L%06d" % (i + loci_offset) for i in range(n_loci)]
+    if format == "str":
+        lines = [" ".join(loci)]
+        for i in range(n_samples):
+            rows = ([], [])
+            for _ in range(n_loci):
+                if rand.random() < missing:
+                    rows[0].append("-9")
+                    rows[1].append("-9")
+                else:
+                    rows[0].append(rand.choice("12"))
+                    rows[1].append(rand.choice("12"))
+            name = "%s%06d" % (prefix, i)
+            lines.append(name + " " + " ".join(rows[0]))
+            lines.append(name + " " + " ".join(rows[1]))
+        return "\n".join(lines) + "\n"
+    delimiter = DELIMITER[format]
+    lines = ["ID" + delimiter + delimiter.join(loci)]
+    for i in range(n_samples):
+        geno = [
+            "" if rand.random() < missing else rand.choice(["11", "12", "22"])
+            for _ in range(n_loci)
+        ]
+        lines.append("%s%06d" % (prefix, i) + delimiter + delimiter.join(geno))
+    return "\n".join(lines) + "\n"
+
+
+def generate_output(n_samples, k, seed=0, prefix="S"):
+    # The parts of a STRUCTURE `_f` output file that `QFile.parse` reads
+    rand = random.Random(seed)
+    lines = [
+        "Run parameters:",
+        "Estimated Ln Prob of Data   = %.1f" % (-1000 - rand.random() * 100),
+        "",
+        "Inferred ancestry of individuals:",
+        "        Label (%Miss) :  Inferred clusters",
+    ]
+    for i in range(n_samples):
+        q = [rand.random() for _ in range(k)]
+        total = sum(q)
+        lines.append("%4d %s%06d (%d) : %s" % (
+            i + 1, prefix, i, rand.randint(0, 10),
+            " ".join("%.3f" % (v / total) for v in q)))
+    return "\n".join(lines) + "\n\n"
+
+
+class Case(object):
+    # `setup` builds the arguments of `run` outside of the measurements,
+    # `items` is the unit of the reported throughput
+    def __init__(self, name, run, setup=tuple, items=1, unit="items"):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.items = items
+        self.unit = unit
+
+    def time(self, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            args = self.setup()
+            start = time.perf_counter()
+            self.run(*args)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def peak_memory(self):
+        args = self.setup()
+        tracemalloc.start()
+        try:
+            self.run(*args)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+def build_cases(args):
+    n, l, k = args.samples, args.loci, args.k
+    cells = n * l
+    cases = []
+    contents = {
+        format: generate_genotype(n, l, format, args.missing, args.seed)
+        for format in ["str", "csv", "txt"]
+    }
+    for cls in [Genotype, GenotypeMatrix]:
+        for format, content in contents.items():
+            method = "parse_str" if format == "str" else "parse_delim"
+            cases.append(Case(
+                "%s.%s[%s]" % (cls.__name__, method, format),
+                lambda stream, cls=cls, format=format:
+                    cls.parse_file(stream, format),
+                lambda content=content: (io.StringIO(content),),
+                cells, "genotypes"))
+
+    # A reference panel sharing 90% of the loci of the samples
+    reference = generate_genotype(
+        args.reference, l, "str", args.missing, args.seed + 1, prefix="R",
+        loci_offset=l // 10)
+    for cls in [Genotype, GenotypeMatrix]:
+        one = cls.parse_file(io.StringIO(reference), "str")
+        other = cls.parse_file(io.StringIO(contents["csv"]), "csv")
+        cases.append(Case(
+            "%s.combine" % cls.__name__,
+            lambda cls=cls, one=one, other=other: cls.combine(one, other),
+            items=(args.reference + n) * l, unit="genotypes"))
+        combined = cls.combine(one, other)
+        for one_row in [False, True]:
+            cases.append(Case(
+                "%s.write%s" % (cls.__name__, "[one row]" if one_row else ""),
+                lambda stream, data=combined, one_row=one_row:
+                    data.write(stream, one_row_per_ind=one_row),
+                lambda: (io.StringIO(),),
+                combined.n_samples * combined.n_loci, "genotypes"))
+
+    output = generate_output(args.reference + n, k, args.seed)
+    cases.append(Case(
+        "QFile.parse", QFile.parse, lambda: (io.StringIO(output),),
+        args.reference + n, "samples"))
+    parsed = QFile.parse(io.StringIO(output))
+    # The reference samples come first, split in 3 groups as the panels are
+    size = args.reference // 3
+    ranges = [(i * size, (i + 1) * size) for i in range(3)]
+    cases.append(Case(
+        "QFile.summarise",
+        lambda qfile: qfile.summarise(["A", "B", "C"], ranges),
+        lambda: (QFile.from_arrays(parsed.samples, parsed.matrix),),
+        args.reference + n, "samples"))
+
+    if args.only is not None:
+        cases = [case for case in cases if re.search(args.only, case.name)]
+    return cases
+
+
+def config_key(args):
+    return "n=%d,l=%d,k=%d,missing=%g,reference=%d,seed=%d" % (
+        args.samples, args.loci, args.k, args.missing, args.reference,
+        args.seed)
+
+
+def load_baselines(path):
+    if not os.path.isfile(path):
+        return dict()
+    with open(path) as stream:
+        return json.load(stream)
+
+
+def compare(result, baseline, threshold):
+    # Slowdowns and memory growth above `threshold` (a fraction)
+    issues = []
+    if baseline is None:
+        return issues
+    if result["seconds"] > baseline["seconds"] * (1 + threshold):
+        issues.append("time x%.2f" % (result["seconds"] / baseline["seconds"]))
+    if result["peak"] > baseline["peak"] * (1 + threshold):
+        issues.append("memory x%.2f" % (result["peak"] / baseline["peak"]))
+    return issues
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the genotype and Q file readers and writers")
+    parser.add_argument("-n", "--samples", type=int, default=1000)
+    parser.add_argument("-l", "--loci", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("-m", "--missing", type=float, default=0.05)
+    parser.add_argument("--reference", type=int, default=600,
+                        help="samples in the reference panel")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--only", help="regex of the cases to run")
+    parser.add_argument("--baselines", default=BASELINES)
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baselines")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="tolerated slowdown before flagging a regression")
+    args = parser.parse_args(argv)
+
+    key = config_key(args)
+    baselines = load_baselines(args.baselines)
+    previous = baselines.get(key, dict())
+    results = dict()
+    regressions = 0
+    print(key)
+    print("%-32s %9s %16s %10s" % ("case", "time", "throughput", "peak"))
+    for case in build_cases(args):
+        result = dict(seconds=case.time(args.repeat),
+                      peak=case.peak_memory())
+        results[case.name] = result
+        issues = compare(result, previous.get(case.name), args.threshold)
+        regressions += len(issues) > 0
+        print("%-32s %8.4fs %9.3g %s/s %9.1fM %s" % (
+            case.name, result["seconds"], case.items / result["seconds"],
+            case.unit[0], result["peak"] / 2 ** 20,
+            "REGRESSION (%s)" % ", ".join(issues) if issues else ""))
+
+    if args.save:
+        baselines[key] = results
+        with open(args.baselines, "w") as stream:
+            json.dump(baselines, stream, indent=2, sort_keys=True)
+        print("Baselines saved to %s" % args.baselines)
+    return 1 if regressions > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import io
+import sys
+import time
+import random
+import argparse
+
+from wstr.io import Genotype, GenotypeMatrix
+
+
+def legacy_write(genotype, stream):
+    # Writer as it was before the bulk serializer, kept as the baseline
+    print("", " ".join(genotype.loci), file=stream)
+    for sample, geno in genotype:
+        line0 = [sample]
+        line1 = [sample]
+        for locus in genotype.loci:
+            if locus not in geno:
+                line0.append("-9")
+                line1.append("-9")
+                continue
+            line0.append(geno[locus][0])
+            line1.append(geno[locus][1])
+        print(" ".join(line0), file=stream)
+        print(" ".join(line1), file=stream)
+
+
+def generate(n_samples, n_loci, missing=0.05, seed=0):
+    rand = random.Random(seed)
+    lines = ["ID," + ",".join("L%05d" % i for i in range(n_loci))]
+    for i in range(n_samples):
+        geno = [
+            "" if rand.random() < missing else rand.choice(["11", "12", "22"])
+            for _ in range(n_loci)
+        ]
+        lines.append("S%05d," % i + ",".join(geno))
+    return "\n".join(lines) + "\n"
+
+
+def timeit(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark genotype writers")
+    parser.add_argument("-n", "--samples", type=int, default=1000)
+    parser.add_argument("-l", "--loci", type=int, default=2000)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    content = generate(args.samples, args.loci)
+    genotype = Genotype.parse_file(io.StringIO(content), "csv")
+    matrix = GenotypeMatrix.parse_file(io.StringIO(content), "csv")
+
+    cases = [
+        ("legacy", lambda: legacy_write(genotype, io.StringIO())),
+        ("Genotype", lambda: genotype.write(io.StringIO())),
+        ("GenotypeMatrix", lambda: matrix.write(io.StringIO())),
+        ("GenotypeMatrix (one row)",
+         lambda: matrix.write(io.StringIO(), one_row_per_ind=True)),
+    ]
+    print("N=%d L=%d" % (args.samples, args.loci))
+    baseline = None
+    for name, func in cases:
+        seconds = timeit(func, args.repeat)
+        baseline = seconds if baseline is None else baseline
+        print("%-26s %8.3fs  x%.1f" % (name, seconds, baseline / seconds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
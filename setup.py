@@ -13,6 +13,7 @@ setup(
     package_dir={"": "src"},
     install_requires=[
         'Flask',
+        'numpy',
         'sortedcontainers',
         'uWSGI',
         'peewee']
@@ -4,17 +4,33 @@ from flask import Flask
 
 def create_app():
     from .config import Config
+    from .upload import UploadRequest
     app = Flask(__name__, static_url_path=Config.APPLICATION_ROOT)
     app.config.from_object(Config)
+    # Stream uploads to disk, with size limit and format checks
+    app.request_class = UploadRequest
 
     # Create Work directory
     if not os.path.isdir(app.config["WORK_DIR"]):
         os.mkdir(app.config["WORK_DIR"])
 
-    from .db import Job
-    Job.create_table(safe=True)
+    from .db import db, create_tables
+    with db.connection_context():
+        create_tables()
+    # uwsgi forks the workers after loading the app, they must not inherit
+    # the master's sqlite connections
+    db.close_all()
 
     from .views import base
     app.register_blueprint(base, url_prefix=app.config["APPLICATION_ROOT"])
 
+    from .api import api
+    app.register_blueprint(api, url_prefix=app.config["APPLICATION_ROOT"])
+
+    from .monitor import monitor, ALL_HISTOGRAMS
+    # Histograms of a previous instance are stale, and their pids reusable
+    for histograms in ALL_HISTOGRAMS:
+        histograms.clear()
+    app.register_blueprint(monitor, url_prefix=app.config["APPLICATION_ROOT"])
+
     return app
\ No newline at end of file
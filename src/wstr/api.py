@@ -0,0 +1,122 @@
+import hashlib
+import datetime
+
+from flask import Blueprint
+from flask import request, url_for, jsonify, make_response
+from .config import Config
+from .db import Job, encode_cursor, decode_cursor
+
+api = Blueprint("api", __name__)
+
+
+def parse_ids(value):
+    try:
+        ids = sorted(set(int(id) for id in value.split(",") if id != ""))
+    except ValueError:
+        raise ValueError("Invalid job id list")
+    if len(ids) > Config.API_MAX_JOBS:
+        raise ValueError("At most %d jobs per request" % Config.API_MAX_JOBS)
+    return ids
+
+
+def parse_batch(value):
+    if not value.isdigit():
+        raise ValueError("Invalid batch id")
+    return int(value)
+
+
+def parse_since(value):
+    # Either a timestamp or the `next` cursor of a previous response
+    if "," in value:
+        return decode_cursor(value)
+    try:
+        return datetime.datetime.fromisoformat(value), None
+    except ValueError:
+        raise ValueError("Invalid timestamp")
+
+
+def job_urls(job):
+    urls = dict(view=url_for("main.view_task", id=job.id))
+    if job.status == Job.Status.Complete:
+        urls.update(
+            out=url_for("main.download_task_out", id=job.id),
+            log=url_for("main.download_task_log", id=job.id),
+            q=url_for("main.download_task_q", id=job.id))
+    if job.profile and job.has_profile:
+        urls.update(
+            prof=url_for("main.download_task_profile", id=job.id),
+            alloc=url_for("main.download_task_alloc", id=job.id))
+    return urls
+
+
+def job_to_dict(job):
+    return dict(
+        id=job.id,
+        title=job.title,
+        submitter=job.submitter,
+        status=job.status.name,
+        priority=job.priority.name,
+        engine=job.engine.name,
+        param_k=job.param_k,
+        param_k_max=job.param_k_max,
+        param_replicates=job.param_replicates,
+        best_k=job.best_k,
+        batch=job.batch_id,
+        created_at=job.created_at.isoformat(),
+        updated_at=job.updated_at.isoformat(),
+        predicted_runtime=job.predicted_runtime,
+        urls=job_urls(job))
+
+
+def jobs_etag(jobs):
+    # Jobs only change through `save`, which bumps `updated_at`
+    etag = hashlib.sha1()
+    for job in jobs:
+        etag.update(("%d@%s;" % (job.id, job.updated_at.isoformat()))
+                    .encode("utf-8"))
+    return etag.hexdigest()
+
+
+def error(message, status=400):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+
+@api.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    try:
+        if request.args.get("ids", "") != "":
+            jobs = Job.by_ids(parse_ids(request.args["ids"]))
+            next_cursor = None
+        elif request.args.get("batch", "") != "":
+            jobs = Job.by_batch(parse_batch(request.args["batch"]))
+            next_cursor = None
+        elif request.args.get("since", "") != "":
+            jobs, next_cursor = Job.changed_since(
+                *parse_since(request.args["since"]),
+                limit=Config.API_MAX_JOBS)
+        else:
+            return error("Either `ids`, `batch` or `since` is required")
+    except ValueError as err:
+        return error(str(err))
+
+    # Check validators before serializing anything
+    etag = jobs_etag(jobs)
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        response = jsonify(
+            jobs=[job_to_dict(job) for job in jobs],
+            next=encode_cursor(next_cursor))
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+@api.route("/api/jobs/<int:id>/cancel", methods=["POST"])
+def cancel_job(id):
+    job = Job.get_or_none(id=id)
+    if job is None:
+        return error("Unknown job", 404)
+    return jsonify(job_to_dict(job.cancel()))
@@ -0,0 +1,53 @@
+import os
+import tarfile
+import zipfile
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _entry_name(name, extensions):
+    # Flattens the archive layout, skipping hidden and unsupported files
+    name = os.path.basename(name)
+    if name.startswith(".") or "." not in name:
+        return None
+    if name.rsplit(".", 1)[-1] not in extensions:
+        return None
+    return name
+
+
+def _zip_entries(stream, extensions):
+    # The zip index sits at the end of the file, so this needs a seekable
+    # stream (Werkzeug spools large uploads to a temporary file)
+    with zipfile.ZipFile(stream) as archive:
+        for info in archive.infolist():
+            name = _entry_name(info.filename, extensions)
+            if info.is_dir() or name is None:
+                continue
+            with archive.open(info) as entry:
+                yield name, entry
+
+
+def _tar_entries(stream, extensions):
+    # Stream mode, members are read in a single forward pass
+    with tarfile.open(fileobj=stream, mode="r|*") as archive:
+        for member in archive:
+            name = _entry_name(member.name, extensions)
+            if not member.isfile() or name is None:
+                continue
+            yield name, archive.extractfile(member)
+
+
+def iter_entries(filename, stream, extensions):
+    # Yields (filename, stream) for each supported file of the archive, each
+    # stream must be consumed before moving on to the next entry
+    try:
+        if filename.lower().endswith(".zip"):
+            yield from _zip_entries(stream, extensions)
+        else:
+            yield from _tar_entries(stream, extensions)
+    except (zipfile.BadZipFile, tarfile.TarError) as err:
+        raise ValueError("Invalid archive: %s" % err)
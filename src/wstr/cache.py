@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+META_FILE = "meta.json"
+
+
+class _Digest(object):
+    # File-like sink so writers can stream straight into the hash
+    def __init__(self):
+        self._hash = hashlib.sha256()
+
+    def write(self, value):
+        self._hash.update(value.encode("utf-8"))
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def genotype_digest(genotype):
+    digest = _Digest()
+    genotype.write(digest)
+    return digest.hexdigest()
+
+
+def result_key(digest, params, files=()):
+    key = hashlib.sha256(digest.encode("utf-8"))
+    for name in sorted(params):
+        key.update(("%s=%s\n" % (name, params[name])).encode("utf-8"))
+    for path in files:
+        with open(path, "rb") as stream:
+            key.update(stream.read())
+    return key.hexdigest()
+
+
+def _link(source, dest):
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ResultCache(object):
+    def __init__(self, root, max_size, max_age):
+        self._root = root
+        self._max_size = max_size
+        self._max_age = max_age
+
+    @property
+    def enabled(self):
+        return self._max_size > 0
+
+    def _path(self, key):
+        return os.path.join(self._root, key[:2], key)
+
+    def _entries(self):
+        if not os.path.isdir(self._root):
+            return
+        for prefix in os.listdir(self._root):
+            folder = os.path.join(self._root, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for key in os.listdir(folder):
+                if os.path.isfile(os.path.join(folder, key, META_FILE)):
+                    yield os.path.join(folder, key)
+
+    def _is_expired(self, path, now=None):
+        now = time.time() if now is None else now
+        created = os.path.getmtime(os.path.join(path, META_FILE))
+        return now - created > self._max_age
+
+    def fetch(self, key, artifacts):
+        # Links the cached artifacts into place, returns the entry metadata
+        path = self._path(key)
+        meta_file = os.path.join(path, META_FILE)
+        if not self.enabled or not os.path.isfile(meta_file):
+            return None
+        if self._is_expired(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        # Entries missing an artifact (e.g. stored before it was one) are
+        # dropped, so that `store` replaces them once the job has run
+        if not all(os.path.isfile(os.path.join(path, name))
+                   for name in artifacts):
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        try:
+            meta = json.load(open(meta_file, "r"))
+        except (OSError, ValueError):
+            return None
+        # All or nothing: a link left behind would share its inode with the
+        # entry, and the job would then overwrite the entry when it runs
+        suffix = ".%s.tmp" % uuid.uuid4().hex
+        try:
+            for name, dest in artifacts.items():
+                _link(os.path.join(path, name), dest + suffix)
+        except OSError:
+            for dest in artifacts.values():
+                _remove(dest + suffix)
+            return None
+        for dest in artifacts.values():
+            os.replace(dest + suffix, dest)
+        os.utime(path)  # Last access, used for eviction order
+        return meta
+
+    def store(self, key, artifacts, meta):
+        path = self._path(key)
+        if not self.enabled or os.path.isdir(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        os.mkdir(staging)
+        for name, source in artifacts.items():
+            _link(source, os.path.join(staging, name))
+        with open(os.path.join(staging, META_FILE), "w") as stream:
+            json.dump(meta, stream)
+        try:
+            os.rename(staging, path)
+        except OSError:  # Stored concurrently by another process
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+        return path
+
+    def size(self, path):
+        return sum(
+            os.path.getsize(os.path.join(path, name))
+            for name in os.listdir(path))
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        for path in self._entries():
+            if self._is_expired(path, now):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            entries.append((os.path.getmtime(path), self.size(path), path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+class LRUCache(object):
+    # Small thread-safe in-process cache, bounded by number of entries
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        if self._max_size <= 0:
+            return value
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._items)
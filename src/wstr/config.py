@@ -5,13 +5,48 @@ class Config(object):
     APP_PATH = os.getenv("APP_PATH", os.path.dirname(os.path.realpath(__file__)))
     APPLICATION_ROOT = os.getenv("APP_ROOT", "/")
 
-    N_WORKER = os.getenv("N_WORKER", 4)
-    MAX_UPLOAD_SIZE = os.getenv("MAX_UPLOAD_SIZE", 16 * 1024 * 1024)
+    N_WORKER = int(os.getenv("N_WORKER", 4))
+    N_SPOOLER = int(os.getenv("N_SPOOLER", 4))  # Outside of uwsgi only
+    PAGE_SIZE = int(os.getenv("PAGE_SIZE", 25))
+    API_MAX_JOBS = int(os.getenv("API_MAX_JOBS", 500))
+    MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 500))
+    MAX_REPLICATES = int(os.getenv("MAX_REPLICATES", 10))
+    DEFAULT_SEED = int(os.getenv("SEED", 2245))
+    MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 16 * 1024 * 1024))
+    MAX_ARCHIVE_SIZE = int(os.getenv("MAX_ARCHIVE_SIZE", 256 * 1024 * 1024))
+    # Whole request limit, enforced by Flask from the Content-Length
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", MAX_ARCHIVE_SIZE))
+    # Above these missing genotype rates, samples and loci get a warning
+    MAX_MISSING_SAMPLE = float(os.getenv("MAX_MISSING_SAMPLE", 0.5))
+    MAX_MISSING_LOCUS = float(os.getenv("MAX_MISSING_LOCUS", 0.5))
+    # Runtime predictions: refit interval and number of past jobs used
+    PREDICTOR_TTL = int(os.getenv("PREDICTOR_TTL", 300))
+    PREDICTOR_HISTORY = int(os.getenv("PREDICTOR_HISTORY", 500))
+    MAX_WAIT = int(os.getenv("MAX_WAIT", 60 * 60))  # seconds, before aging
+    # High priority skips the fair share, only requests sending this token
+    # in an X-Admin-Token header may use it (nobody when empty)
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    # Fraction of the jobs profiled, besides those submitted with profiling
+    PROFILE_RATE = float(os.getenv("PROFILE_RATE", 0))
+    STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", 2.0))
 
     WORK_DIR = os.path.join(APP_PATH, "work")
+    UPLOAD_DIR = os.path.join(WORK_DIR, "uploads")
+    METRICS_DIR = os.path.join(WORK_DIR, "metrics")
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
     RESOURCE = os.path.join(APP_PATH, "resource")
     MAINPARAMS = os.path.join(RESOURCE, "mainparams")
     EXTRAPARAMS = os.path.join(RESOURCE, "extraparams")
     STRUCTURE_BIN = os.getenv("STRUCTURE", os.path.join(RESOURCE, "structure_src", "structure"))
+    ONE_ROW_PER_IND = os.getenv("ONE_ROW_PER_IND", "0") == "1"
 
-    DB_PATH = os.getenv("DB", os.path.join(WORK_DIR, "wstr.db"))
\ No newline at end of file
+    DB_PATH = os.getenv("DB", os.path.join(WORK_DIR, "wstr.db"))
+    DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", 10))
+    DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 16))
+    DB_STALE_TIMEOUT = int(os.getenv("DB_STALE_TIMEOUT", 300))
+    DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", 16 * 1024))  # KiB
+
+    CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(WORK_DIR, "cache"))
+    CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", 1024 * 1024 * 1024))
+    CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", 30 * 24 * 60 * 60))
+    Q_CACHE_SIZE = int(os.getenv("Q_CACHE_SIZE", 64))
\ No newline at end of file
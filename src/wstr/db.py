@@ -1,22 +1,161 @@
 import os
+import json
+import time
+import shutil
 import datetime
 import uuid
+import random
+import signal
 import subprocess
 import logging
+import threading
 
 from enum import Enum
-from peewee import SqliteDatabase, Model
-from peewee import CharField, IntegerField, DateTimeField
+from concurrent.futures import ThreadPoolExecutor
+from peewee import Model
+from peewee import CharField, IntegerField, DateTimeField, FloatField
+from peewee import BooleanField
+from peewee import ForeignKeyField, fn
+from playhouse.migrate import SqliteMigrator, migrate
+from playhouse.pool import PooledSqliteDatabase
 from werkzeug.utils import secure_filename
 from uwsgidecorators import spool
 from .config import Config
 from .name import generate_name
-from .io import get_std_references, QFile, Reference, Genotype
+from .cache import ResultCache, genotype_digest, result_key
+from .download import compress, COMPRESSED_EXT
+from .upload import UploadSink
+from .structure import write_params, structure_command, parse_likelihood
+from .structure import evanno, best_k
+from .structure import BUFFER_SIZE
+from .stages import StageRecorder, usage_from_rusage, exit_code
+from .profiling import Profiler
+from .metrics import ProcessHistograms, STAGE_BUCKETS, JOB_BUCKETS
 
-REF_PANELS = get_std_references(Config.RESOURCE)
-
-db = SqliteDatabase(Config.DB_PATH)
+# WAL lets the web workers keep reading while the spoolers write. Each
+# process keeps its own pool, connections are returned on `close()` and may
+# be picked up by another thread afterwards.
+db = PooledSqliteDatabase(
+    Config.DB_PATH,
+    check_same_thread=False,
+    max_connections=Config.DB_MAX_CONNECTIONS,
+    stale_timeout=Config.DB_STALE_TIMEOUT,
+    timeout=Config.DB_TIMEOUT,
+    pragmas=dict(
+        journal_mode="wal",
+        synchronous="normal",
+        cache_size=-Config.DB_CACHE_SIZE,
+        foreign_keys=1))
 logger = logging.getLogger()
+# Durations of the jobs and their stages, observed by the process finishing
+# them and summed by the one answering a scrape (see `monitor`)
+queue_time = ProcessHistograms(
+    os.path.join(Config.METRICS_DIR, "queue"), JOB_BUCKETS,
+    Config.METRICS_FLUSH_INTERVAL)
+run_time = ProcessHistograms(
+    os.path.join(Config.METRICS_DIR, "run"), JOB_BUCKETS,
+    Config.METRICS_FLUSH_INTERVAL)
+stage_time = ProcessHistograms(
+    os.path.join(Config.METRICS_DIR, "stage"), STAGE_BUCKETS,
+    Config.METRICS_FLUSH_INTERVAL)
+result_cache = ResultCache(
+    Config.CACHE_DIR, Config.CACHE_MAX_SIZE, Config.CACHE_MAX_AGE)
+
+# Reference panels are only loaded by the processes that actually need them
+_ref_panels = None
+_ref_panels_lock = threading.Lock()
+
+
+def _reset_ref_panels_lock():
+    global _ref_panels_lock
+    _ref_panels_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_ref_panels_lock)
+
+
+def get_ref_panels():
+    global _ref_panels
+    if _ref_panels is None:
+        with _ref_panels_lock:
+            if _ref_panels is None:
+                from .io import get_std_references
+                _ref_panels = get_std_references(Config.RESOURCE)
+    return _ref_panels
+
+
+_predictor = None
+_predictor_fitted_at = 0
+
+
+def runtime_predictor():
+    # Refitted on recent jobs every PREDICTOR_TTL seconds, per process
+    global _predictor, _predictor_fitted_at
+    from .predict import RuntimePredictor
+    if (_predictor is None or
+            time.time() - _predictor_fitted_at > Config.PREDICTOR_TTL):
+        jobs = Job.select().where(
+            (Job.status == Job.Status.Complete) &
+            (Job.engine == Job.Engine.Structure) &
+            Job.started_at.is_null(False) &
+            Job.n_samples.is_null(False)
+        ).order_by(Job.finished_at.desc()).limit(Config.PREDICTOR_HISTORY)
+        jobs = [job for job in jobs if job.duration is not None]
+        _predictor = RuntimePredictor().fit(
+            [job.n_samples for job in jobs], [job.n_loci for job in jobs],
+            [job.load for job in jobs], [job.duration for job in jobs])
+        _predictor_fitted_at = time.time()
+    return _predictor
+
+
+def write_transaction():
+    # Take the write lock upfront, so a transaction never has to upgrade its
+    # lock (and fail with "database is locked") halfway through
+    return db.atomic("IMMEDIATE")
+
+
+def encode_cursor(cursor):
+    # Keyset cursor of `Job.page` and `Job.changed_since`, (updated_at, id)
+    if cursor is None:
+        return None
+    updated_at, id = cursor
+    return "%s,%d" % (updated_at.isoformat(), id)
+
+
+def decode_cursor(value):
+    try:
+        updated_at, id = value.split(",")
+        return datetime.datetime.fromisoformat(updated_at), int(id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def seconds_between(start, end):
+    # SQL expression of the seconds elapsed between two datetime columns
+    return (fn.julianday(end) - fn.julianday(start)) * 86400
+
+
+def flush_metrics():
+    # Spoolers may idle for long after a job, don't wait for the next one
+    for histograms in [queue_time, run_time, stage_time]:
+        histograms.flush()
+
+
+def spooler_processes():
+    # The uwsgi setting itself when running under it, so the two can't drift
+    try:
+        import uwsgi
+        value = uwsgi.opt.get("spooler-processes")
+    except (ImportError, AttributeError):
+        value = None
+    if isinstance(value, list):
+        value = value[-1]
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return Config.N_SPOOLER
 
 
 class EnumField(IntegerField):
@@ -31,6 +170,15 @@ class EnumField(IntegerField):
         return self.choices(value)
 
 
+class Batch(Model):
+    title = CharField(default=generate_name)
+    submitter = CharField(null=False)
+    created_at = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        database = db
+
+
 class Job(Model):
     class Status (Enum):
         Queued = 0
@@ -38,11 +186,36 @@ class Job(Model):
         Complete = 2
         Failure = 3
         Canceled = 4
+
+    class Engine (Enum):
+        Structure = 0
+        # Supervised, on the allele frequencies of the reference panel
+        Projection = 1
+
+    class Priority (Enum):
+        Low = 0
+        Normal = 1
+        High = 2
     title = CharField(default=generate_name)
     submitter = CharField(null=False)
     status = EnumField(default=Status.Queued, choices=Status)
+    priority = EnumField(default=Priority.Normal, choices=Priority)
+    engine = EnumField(default=Engine.Structure, choices=Engine)
     param_k = IntegerField(default=3)
+    param_k_max = IntegerField(null=True)
     param_reference = CharField(default="")
+    param_replicates = IntegerField(default=1)
+    param_seed = IntegerField(default=Config.DEFAULT_SEED)
+    best_k = IntegerField(null=True)
+    # Size of the STRUCTURE input, reference panel included
+    n_samples = IntegerField(null=True)
+    n_loci = IntegerField(null=True)
+    predicted_runtime = FloatField(null=True)
+    profile = BooleanField(default=False)
+    data_hash = CharField(null=True)
+    cache_key = CharField(null=True)
+    batch = ForeignKeyField(
+        Batch, null=True, backref="jobs", on_delete="SET NULL")
     workdir = CharField(null=False)
     data_file = CharField(null=False)
     input_file = CharField(null=False)
@@ -50,22 +223,292 @@ class Job(Model):
     log_file = CharField(null=False)
     q_file = CharField(null=False)
 
-    created_at = DateTimeField(default=datetime.datetime.now)
+    created_at = DateTimeField(default=datetime.datetime.now, index=True)
     updated_at = DateTimeField()
+    started_at = DateTimeField(null=True)
+    finished_at = DateTimeField(null=True)
 
     def update_status(self, status):
         if type(status) is not Job.Status:
             raise ValueError("Invalid status value")
-        self.status = status
-        self.save()
+        with write_transaction():
+            # A canceled job stays canceled, whatever its runs end up doing,
+            # and `cancel` already recorded when it finished
+            canceled = Job.select(Job.finished_at).where(
+                (Job.id == self.id) & (Job.status == Job.Status.Canceled)
+            ).first()
+            if canceled is not None:
+                status = Job.Status.Canceled
+                self.finished_at = canceled.finished_at
+            self.status = status
+            now = datetime.datetime.now()
+            if status == Job.Status.Running:
+                self.started_at = now
+                queue_time.observe(
+                    "", (now - self.created_at).total_seconds())
+            elif status != Job.Status.Queued and self.finished_at is None:
+                self.finished_at = now
+                if self.started_at is not None:
+                    run_time.observe(
+                        status.name, (now - self.started_at).total_seconds())
+            self.save()
         return self
 
+    def is_canceled(self):
+        return Job.select().where(
+            (Job.id == self.id) & (Job.status == Job.Status.Canceled)
+        ).exists()
+
     def cancel(self):
+        now = datetime.datetime.now()
+        with write_transaction():
+            canceled = Job.update(
+                status=Job.Status.Canceled, updated_at=now, finished_at=now
+            ).where(
+                (Job.id == self.id) &
+                Job.status.in_([Job.Status.Queued, Job.Status.Running])
+            ).execute()
+        if canceled == 0:
+            return self
         self.status = Job.Status.Canceled
-        self.save
+        self.updated_at = self.finished_at = now
+        if self.started_at is not None:
+            run_time.observe(
+                self.status.name, (now - self.started_at).total_seconds())
+            run_time.flush()
+        # Runs already started are killed, the others won't start
+        for run in self.runs.where(Run.pid.is_null(False)):
+            kill_process_group(run.pid)
         return self
 
+    @property
+    def is_sweep(self):
+        return self.param_k_max is not None and self.param_k_max > self.param_k
+
+    @property
+    def k_values(self):
+        if not self.is_sweep:
+            return [self.param_k]
+        return list(range(self.param_k, self.param_k_max + 1))
+
+    def create_runs(self):
+        runs = []
+        for k in self.k_values:
+            for replicate in range(self.param_replicates):
+                name = "k%02d_r%02d" % (k, replicate)
+                workdir = os.path.join(self.workdir, name)
+                os.makedirs(workdir, exist_ok=True)
+                runs.append(Run(
+                    job=self,
+                    param_k=k,
+                    replicate=replicate,
+                    seed=self.param_seed + replicate,
+                    workdir=workdir,
+                    output_file=os.path.join(workdir, "outputfile_f"),
+                    log_file=os.path.join(workdir, "logfile"),
+                    q_file=os.path.join(workdir, "qfile")))
+        with write_transaction():
+            Run.delete().where(Run.job == self).execute()
+            for run in runs:
+                run.save()
+        return runs
+
+    def likelihoods(self):
+        likelihoods = dict()
+        query = self.runs\
+            .where(Run.ln_prob.is_null(False))\
+            .order_by(Run.param_k, Run.replicate)
+        for run in query:
+            likelihoods.setdefault(run.param_k, []).append(run.ln_prob)
+        return likelihoods
+
+    def evanno(self):
+        likelihoods = self.likelihoods()
+        if len(likelihoods) == 0:
+            return dict()
+        return evanno(likelihoods)
+
+    def data_digest(self):
+        # Computed by `validate` while it reads the file anyway, parsed again
+        # only for jobs that didn't go through it
+        from .io import GenotypeMatrix
+        if self.data_hash is not None:
+            return self.data_hash
+        ext = self.data_file.split(".")[-1]
+        try:
+            data = GenotypeMatrix.parse_file(open(self.data_file, "r"), ext)
+        except ValueError:
+            return None
+        return genotype_digest(data)
+
+    @property
+    def profile_file(self):
+        return os.path.join(self.workdir, "profile.prof")
+
+    @property
+    def alloc_file(self):
+        return os.path.join(self.workdir, "allocations.txt")
+
+    @property
+    def has_profile(self):
+        return os.path.isfile(self.profile_file)
+
+    def profiler(self):
+        # Python stages of `execute_job`, when asked for or sampled
+        return Profiler(
+            self.profile_file, self.alloc_file, enabled=self.profile)
+
+    @property
+    def validation_file(self):
+        return os.path.join(self.workdir, "validation.json")
+
+    def validation(self):
+        if not os.path.isfile(self.validation_file):
+            return None
+        with open(self.validation_file, "r") as stream:
+            return json.load(stream)
+
+    def validate(self):
+        # Rejects malformed files before they're queued, keeps the warnings
+        from .io.validate import validate, InvalidGenotypeError
+        loci, reference = None, None
+        if self.param_reference != "":
+            reference = get_ref_panels()[self.param_reference]
+            loci = reference.index.columns
+        ext = self.data_file.split(".")[-1]
+        with open(self.data_file, "r") as stream:
+            report = validate(
+                stream, ext, loci,
+                max_missing_sample=Config.MAX_MISSING_SAMPLE,
+                max_missing_locus=Config.MAX_MISSING_LOCUS)
+        if not report.ok:
+            raise InvalidGenotypeError(
+                report, os.path.basename(self.data_file))
+        report.save(self.validation_file)
+        self.data_hash = report.digest
+        self.n_samples, self.n_loci = report.n_samples, report.n_loci
+        if reference is not None:
+            index = reference.index
+            self.n_samples += reference.genotype.n_samples
+            self.n_loci = index.n_loci + index.n_unknown(report.loci)
+        return report
+
+    @property
+    def load(self):
+        from .predict import run_load
+        return run_load(self.k_values, self.param_replicates, Config.N_WORKER)
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def predict_runtime(self):
+        # Projections take seconds, and go first as such
+        if self.engine != Job.Engine.Structure:
+            return None
+        if self.n_samples is None or self.n_loci is None:
+            return None
+        return runtime_predictor().predict(
+            self.n_samples, self.n_loci, self.load)
+
+    def eta(self):
+        # Rough expected completion time: running jobs from their start,
+        # queued ones once the work ahead of them is spread over the spoolers
+        if self.predicted_runtime is None:
+            return None
+        runtime = datetime.timedelta(seconds=self.predicted_runtime)
+        if self.status == Job.Status.Running:
+            return self.started_at + runtime
+        if self.status != Job.Status.Queued:
+            return None
+        now = datetime.datetime.now()
+        ahead = Job.select().where(
+            (Job.status == Job.Status.Running) |
+            ((Job.status == Job.Status.Queued) & (
+                (Job.priority > self.priority) |
+                ((Job.priority == self.priority) &
+                 (fn.IFNULL(Job.predicted_runtime, 0) <
+                  self.predicted_runtime)))))
+        work = 0
+        for job in ahead:
+            if job.predicted_runtime is None:
+                continue
+            if job.status == Job.Status.Running:
+                elapsed = (now - job.started_at).total_seconds()
+                work += max(job.predicted_runtime - elapsed, 0)
+            else:
+                work += job.predicted_runtime
+        wait = datetime.timedelta(seconds=work / spooler_processes())
+        return now + wait + runtime
+
+    def result_key(self):
+        digest = self.data_digest()
+        if digest is None:
+            return None
+        params = dict(
+            k=self.param_k,
+            k_max=self.param_k_max,
+            replicates=self.param_replicates,
+            seed=self.param_seed,
+            reference=self.param_reference,
+            one_row_per_ind=Config.ONE_ROW_PER_IND)
+        if self.engine != Job.Engine.Structure:
+            # Deterministic, and K comes from the reference panel
+            params = dict(
+                reference=self.param_reference, engine=self.engine.name)
+        return result_key(
+            digest, params,
+            [Config.MAINPARAMS, Config.EXTRAPARAMS])
+
+    def artifacts(self, compressed=True):
+        artifacts = dict(
+            outputfile_f=self.output_file,
+            logfile=self.log_file,
+            qfile=self.q_file)
+        if compressed:
+            for name, path in list(artifacts.items()):
+                artifacts[name + COMPRESSED_EXT] = path + COMPRESSED_EXT
+        return artifacts
+
+    def compress_artifacts(self):
+        for path in self.artifacts(compressed=False).values():
+            compress(path)
+
+    def complete_from_cache(self):
+        if self.cache_key is None:
+            return False
+        meta = result_cache.fetch(self.cache_key, self.artifacts())
+        if meta is None:
+            return False
+        self.best_k = meta["best_k"]
+        if self.engine != Job.Engine.Structure:
+            self.param_k = self.best_k
+        with write_transaction():
+            for run in meta["runs"]:
+                Run.create(
+                    job=self, status=Job.Status.Complete, workdir="",
+                    output_file="", log_file="", q_file="", **run)
+            self.update_status(Job.Status.Complete)
+        return True
+
+    def store_in_cache(self):
+        if self.cache_key is None:
+            return
+        runs = [
+            dict(
+                param_k=run.param_k, replicate=run.replicate,
+                seed=run.seed, returncode=run.returncode,
+                ln_prob=run.ln_prob)
+            for run in self.runs
+        ]
+        result_cache.store(
+            self.cache_key, self.artifacts(),
+            dict(best_k=self.best_k, runs=runs))
+
     def q(self):
+        from .io import QFile
         if self.status != Job.Status.Complete:
             return QFile()
         return QFile.open(open(self.q_file, "r"))
@@ -74,63 +517,496 @@ class Job(Model):
         self.updated_at = datetime.datetime.now()
         return super(Job, self).save(*args, **kwargs)
 
+    @classmethod
+    def page(cls, since=None, submitter=None, status=None, batch=None,
+             cursor=None, limit=25):
+        # Keyset pagination over (updated_at, id), newest first. Every filter
+        # is backed by an index ending in (updated_at, id).
+        query = cls.select()
+        if since is not None:
+            # A job is never updated before its creation
+            query = query.where(
+                (cls.updated_at > since) & (cls.created_at > since))
+        if submitter is not None:
+            query = query.where(cls.submitter == submitter)
+        if status is not None:
+            query = query.where(cls.status == status)
+        if batch is not None:
+            query = query.where(cls.batch == batch)
+        if cursor is not None:
+            updated_at, id = cursor
+            query = query.where(
+                (cls.updated_at < updated_at) |
+                ((cls.updated_at == updated_at) & (cls.id < id)))
+        jobs = list(query
+                    .order_by(cls.updated_at.desc(), cls.id.desc())
+                    .limit(limit + 1))
+        if len(jobs) <= limit:
+            return jobs, None
+        jobs = jobs[:limit]
+        return jobs, (jobs[-1].updated_at, jobs[-1].id)
+
+    @classmethod
+    def claim(cls):
+        # Next job to run: highest priority first, then the submitters with
+        # the fewest running jobs (fair share), then the shortest expected
+        # job. Jobs waiting for longer than MAX_WAIT skip the size ordering.
+        running = Job.alias()
+        share = running.select(fn.COUNT(running.id)).where(
+            (running.submitter == cls.submitter) &
+            (running.status == cls.Status.Running))
+        starved = cls.created_at < (
+            datetime.datetime.now() -
+            datetime.timedelta(seconds=Config.MAX_WAIT))
+        with write_transaction():
+            job = cls.select()\
+                .where(cls.status == cls.Status.Queued)\
+                .order_by(
+                    cls.priority.desc(), share, starved.desc(),
+                    fn.IFNULL(cls.predicted_runtime, 0), cls.id)\
+                .first()
+            if job is not None:
+                job.update_status(cls.Status.Running)
+        return job
+
+    @classmethod
+    def by_ids(cls, ids):
+        return list(cls.select().where(cls.id.in_(ids)).order_by(cls.id))
+
+    @classmethod
+    def by_batch(cls, batch):
+        return list(cls.select().where(cls.batch == batch).order_by(cls.id))
+
+    @classmethod
+    def changed_since(cls, updated_at, id=None, limit=500):
+        # Oldest changes first, the returned cursor resumes after the last
+        # job and is the given one when nothing changed
+        query = cls.select()
+        if id is None:
+            query = query.where(cls.updated_at > updated_at)
+        else:
+            query = query.where(
+                (cls.updated_at > updated_at) |
+                ((cls.updated_at == updated_at) & (cls.id > id)))
+        jobs = list(query
+                    .order_by(cls.updated_at, cls.id)
+                    .limit(limit))
+        if len(jobs) == 0:
+            return jobs, (updated_at, id or 0)
+        return jobs, (jobs[-1].updated_at, jobs[-1].id)
+
+    @classmethod
+    def count_since(cls, since=None, submitter=None, status=None,
+                    batch=None):
+        query = cls.select()
+        if since is not None:
+            query = query.where(cls.created_at > since)
+        if submitter is not None:
+            query = query.where(cls.submitter == submitter)
+        if status is not None:
+            query = query.where(cls.status == status)
+        if batch is not None:
+            query = query.where(cls.batch == batch)
+        return query.count()
+
+    @classmethod
+    def count_by_status(cls, statuses=None):
+        statuses = list(Job.Status) if statuses is None else statuses
+        counts = dict((status, 0) for status in statuses)
+        query = cls.select(cls.status, fn.COUNT(cls.id).alias("count")) \
+            .where(cls.status.in_(statuses)).group_by(cls.status)
+        for job in query:
+            counts[job.status] = job.count
+        return counts
+
+    @classmethod
+    def stats(cls, since=None):
+        # Size and duration of the completed jobs
+        duration = seconds_between(cls.started_at, cls.finished_at)
+        query = cls.select(
+            fn.COUNT(cls.id).alias("count"),
+            fn.AVG(cls.n_samples).alias("mean_samples"),
+            fn.AVG(cls.n_loci).alias("mean_loci"),
+            fn.AVG(duration).alias("mean_duration"),
+            fn.MAX(duration).alias("max_duration"),
+        ).where(cls.status == Job.Status.Complete)
+        if since is not None:
+            query = query.where(cls.created_at > since)
+        return query.dicts().get()
+
     class Meta:
         database = db
+        indexes = (
+            (("updated_at", "id"), False),
+            (("submitter", "updated_at", "id"), False),
+            (("status", "updated_at", "id"), False),
+            (("batch", "updated_at", "id"), False),
+        )
 
 
-def submit_job(data, **kwargs):
+class Run(Model):
+    job = ForeignKeyField(Job, backref="runs", on_delete="CASCADE")
+    status = EnumField(default=Job.Status.Queued, choices=Job.Status)
+    param_k = IntegerField()
+    replicate = IntegerField(default=0)
+    seed = IntegerField()
+    workdir = CharField(null=False)
+    output_file = CharField(null=False)
+    log_file = CharField(null=False)
+    q_file = CharField(null=False)
+    pid = IntegerField(null=True)
+    returncode = IntegerField(null=True)
+    ln_prob = FloatField(null=True)
+
+    def update_status(self, status):
+        if type(status) is not Job.Status:
+            raise ValueError("Invalid status value")
+        self.status = status
+        with write_transaction():
+            self.save()
+        return self
+
+    class Meta:
+        database = db
+
+
+class JobStage(Model):
+    # Resource usage of one stage of a job, or of one of its runs
+    job = ForeignKeyField(Job, backref="stages", on_delete="CASCADE")
+    run = ForeignKeyField(
+        Run, null=True, backref="stages", on_delete="CASCADE")
+    name = CharField(index=True)
+    started_at = DateTimeField(index=True)
+    wall_time = FloatField()
+    cpu_time = FloatField()
+    max_rss = IntegerField()
+    read_bytes = IntegerField()
+    write_bytes = IntegerField()
+
+    @classmethod
+    def save_all(cls, job, stages):
+        rows = [
+            dict(job=job, run=stage.run, name=stage.name,
+                 started_at=stage.started_at, **stage.usage._asdict())
+            for stage in stages
+        ]
+        if len(rows) == 0:
+            return
+        with write_transaction():
+            cls.insert_many(rows).execute()
+        for stage in stages:
+            stage_time.observe(stage.name, stage.usage.wall_time)
+
+    @classmethod
+    def summary(cls, job=None, since=None):
+        # Totals per stage name, in execution order
+        query = cls.select(
+            cls.name,
+            fn.COUNT(cls.id).alias("count"),
+            fn.SUM(cls.wall_time).alias("wall_time"),
+            fn.AVG(cls.wall_time).alias("mean_wall_time"),
+            fn.SUM(cls.cpu_time).alias("cpu_time"),
+            fn.AVG(cls.cpu_time).alias("mean_cpu_time"),
+            fn.MAX(cls.max_rss).alias("max_rss"),
+            fn.SUM(cls.read_bytes).alias("read_bytes"),
+            fn.SUM(cls.write_bytes).alias("write_bytes"))
+        if job is not None:
+            query = query.where(cls.job == job)
+        if since is not None:
+            query = query.where(cls.started_at > since)
+        query = query.group_by(cls.name).order_by(fn.MIN(cls.started_at))
+        return list(query.dicts())
+
+    class Meta:
+        database = db
+
+
+# Covered by the composite indexes of `Job.Meta`, they only slowed writes
+OBSOLETE_INDEXES = dict(job=["job_status", "job_updated_at"])
+
+
+def create_tables():
+    # `create_table` won't add columns to existing tables, so migrate them.
+    # Their indexes come after the columns: SQLite would take the quoted name
+    # of a missing column as a string and index that instead.
+    models = [Batch, Job, Run, JobStage]
+    existing = set(db.get_tables())
+    db.create_tables(
+        [m for m in models if m._meta.table_name not in existing], safe=True)
+    migrator = SqliteMigrator(db)
+    for model in models:
+        table = model._meta.table_name
+        if table not in existing:
+            continue
+        columns = set(c.name for c in db.get_columns(table))
+        operations = [
+            migrator.add_column(table, field.column_name, field)
+            for field in model._meta.sorted_fields
+            if field.column_name not in columns
+        ]
+        indexes = set(i.name for i in db.get_indexes(table))
+        operations.extend(
+            migrator.drop_index(table, name)
+            for name in OBSOLETE_INDEXES.get(table, [])
+            if name in indexes)
+        if len(operations) > 0:
+            migrate(*operations)
+        model._schema.create_indexes(safe=True)
+
+
+def kill_process_group(pid, sig=signal.SIGTERM):
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def create_workdir():
     workdir = os.path.join(Config.WORK_DIR, uuid.uuid4().hex)
     while os.path.isdir(workdir):
         workdir = os.path.join(Config.WORK_DIR, uuid.uuid4().hex)
     os.mkdir(workdir)
+    return workdir
+
+
+def prepare_job(filename, stream, **kwargs):
+    # Saves the data file into a new workdir, the job itself isn't saved yet
+    workdir = create_workdir()
     job = Job(
         **kwargs,
         workdir=workdir,
-        data_file=os.path.join(workdir, secure_filename(data.filename)),
+        data_file=os.path.join(workdir, secure_filename(filename)),
         input_file=os.path.join(workdir, "inputfile"),
         output_file=os.path.join(workdir, "outputfile_f"),
         log_file=os.path.join(workdir, "logfile"),
         q_file=os.path.join(workdir, "qfile"))
-    data.save(job.data_file)
-    job.save()
+    try:
+        if isinstance(stream, UploadSink):
+            # Already on disk, next to the workdirs
+            stream.move(job.data_file)
+        else:
+            with open(job.data_file, "wb") as dest:
+                shutil.copyfileobj(stream, dest, BUFFER_SIZE)
+        job.validate()
+        job.predicted_runtime = job.predict_runtime()
+        job.profile = job.profile or random.random() < Config.PROFILE_RATE
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    if result_cache.enabled:
+        job.cache_key = job.result_key()
+    return job
+
+
+def enqueue_job(job):
+    if job.complete_from_cache():
+        return job
     execute_job({"id".encode("utf-8"): str(job.id).encode("utf-8")})
     return job
 
 
+def submit_job(data, **kwargs):
+    job = prepare_job(data.filename, data.stream, **kwargs)
+    job.save()
+    return enqueue_job(job)
+
+
+def submit_batch(entries, title=None, **kwargs):
+    # `entries` yields (filename, stream) pairs, e.g. from an archive
+    title = generate_name() if title is None else title
+    jobs = []
+    try:
+        for filename, stream in entries:
+            if len(jobs) >= Config.MAX_BATCH_SIZE:
+                raise ValueError(
+                    "At most %d files per batch" % Config.MAX_BATCH_SIZE)
+            jobs.append(prepare_job(
+                filename, stream, title="%s/%s" % (title, filename), **kwargs))
+        if len(jobs) == 0:
+            raise ValueError("No genotype file found")
+    except Exception:
+        for job in jobs:
+            shutil.rmtree(job.workdir, ignore_errors=True)
+        raise
+    with write_transaction():
+        batch = Batch.create(title=title, submitter=kwargs["submitter"])
+        for job in jobs:
+            job.batch = batch
+            job.save()
+    for job in jobs:
+        enqueue_job(job)
+    return batch
+
+
+def execute_run(run, input_file, n_loci, n_samples, params, reference,
+                recorder):
+    # Runs in a pool thread, give its connection back once done
+    with db.connection_context():
+        return _execute_run(
+            run, input_file, n_loci, n_samples, params, reference, recorder)
+
+
+def _execute_run(run, input_file, n_loci, n_samples, params, reference,
+                 recorder):
+    from .io import QFile
+    if run.job.is_canceled():
+        return run.update_status(Job.Status.Canceled)
+    run.update_status(Job.Status.Running)
+    cmd = structure_command(
+        Config.STRUCTURE_BIN, *params, run.param_k, n_loci, n_samples,
+        input_file, run.output_file, seed=run.seed)
+    with open(run.log_file, "w") as log:
+        started_at, start = datetime.datetime.now(), time.perf_counter()
+        # In its own process group, which is what `Job.cancel` kills
+        proc = subprocess.Popen(
+            cmd, stdout=log, cwd=run.workdir, start_new_session=True)
+        run.pid = proc.pid
+        with write_transaction():
+            run.save()
+        if run.job.is_canceled():  # Canceled before the pid was saved
+            kill_process_group(proc.pid)
+        # Reaped here rather than by `proc.wait()` to get its rusage
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = exit_code(status)
+        recorder.add(
+            "structure", started_at,
+            usage_from_rusage(rusage, time.perf_counter() - start), run)
+    run.pid = None
+    run.returncode = proc.returncode
+    if proc.returncode != 0:
+        if run.job.is_canceled():
+            return run.update_status(Job.Status.Canceled)
+        return run.update_status(Job.Status.Failure)
+    with recorder.measure("parse_q", run):
+        run.ln_prob = parse_likelihood(open(run.output_file, "r"))
+        qfile = QFile.parse(open(run.output_file, "r"))
+    if reference is not None:
+        with recorder.measure("summarise", run):
+            qfile.summarise(reference.groups, reference.ranges)
+    with recorder.measure("write_q", run):
+        with open(run.q_file, "w") as stream:
+            qfile.write(stream)
+    return run.update_status(Job.Status.Complete)
+
+
+def execute_runs(runs, input_file, n_loci, n_samples, params, reference,
+                 recorder):
+    with ThreadPoolExecutor(max_workers=Config.N_WORKER) as pool:
+        futures = [
+            pool.submit(
+                execute_run, run, input_file, n_loci, n_samples, params,
+                reference, recorder)
+            for run in runs
+        ]
+        return [future.result() for future in futures]
+
+
 @spool
 def execute_job(args):
-    print("Processing job `%s`" % args["id"])
-    job = Job.get_by_id(int(args["id"]))
-    if job.status != Job.Status.Queued:
-        return
+    # Every submission spools one of these, but the job to run is picked by
+    # `Job.claim` rather than taken in submission order. Each spooler keeps
+    # going while jobs are queued, leftover tasks find an empty queue.
+    print("Processing queue after job `%s`" % args["id"])
+    with db.connection_context():
+        while True:
+            job = Job.claim()
+            if job is None:
+                break
+            _execute_job(job)
+
+
+def _execute_job(job):
+    recorder = StageRecorder()
+    flush_metrics()
     try:
-        job.update_status(Job.Status.Running)
-
-        ext = job.data_file.split(".")[-1]
-        data = Genotype.parse_file(open(job.data_file, "r"), ext)
-        if job.param_reference in REF_PANELS:
-            ref = REF_PANELS.get(job.param_reference)
-            data = Genotype.combine(ref.genotype, data)
-        data.write(open(job.input_file, "w"))
-        cmd = [
-            Config.STRUCTURE_BIN,
-            "-m", Config.MAINPARAMS,
-            "-e", Config.EXTRAPARAMS,
-            "-K", str(job.param_k),
-            "-L", str(data.n_loci),
-            "-N", str(data.n_samples),
-            "-i", job.input_file,
-            "-o", job.output_file[:-2]
-        ]
-        proc = subprocess.run(cmd, stdout=open(job.log_file, "w"), cwd=job.workdir)
-        if proc.returncode != 0:
-            raise ValueError("Unexpected execution error")
-        qfile = QFile.parse(open(job.output_file, "r"))
-        if job.param_reference != "":
-            ref = REF_PANELS[job.param_reference]
-            qfile.summarise(ref.groups, ref.ranges)
-        qfile.write(open(job.q_file, "w"))
-        job.update_status(Job.Status.Complete)
+        with job.profiler() as profiler:
+            _process_job(job, recorder, profiler)
     except Exception as err:
         job.update_status(Job.Status.Failure)
         logger.error(str(err), exc_info=True)
+    finally:
+        JobStage.save_all(job, recorder.stages)
+        flush_metrics()
+
+
+def _process_job(job, recorder, profiler):
+    from .io import GenotypeMatrix
+    panels = get_ref_panels()
+
+    ext = job.data_file.split(".")[-1]
+    with recorder.measure("parse"):
+        data = GenotypeMatrix.parse_file(open(job.data_file, "r"), ext)
+    reference = panels.get(job.param_reference)
+    if job.engine == Job.Engine.Projection:
+        return _project_job(job, data, reference, recorder)
+    if reference is not None:
+        with recorder.measure("merge"):
+            data = GenotypeMatrix.combine(reference.genotype, data)
+    job.n_samples, job.n_loci = data.n_samples, data.n_loci
+    mainparams = write_params(
+        Config.MAINPARAMS, os.path.join(job.workdir, "mainparams"),
+        ONEROWPERIND=int(Config.ONE_ROW_PER_IND))
+    # Seeds are only honoured when STRUCTURE doesn't randomize them
+    extraparams = write_params(
+        Config.EXTRAPARAMS, os.path.join(job.workdir, "extraparams"),
+        RANDOMIZE=0)
+    with recorder.measure("write_input"):
+        with open(job.input_file, "w", buffering=BUFFER_SIZE) as stream:
+            data.write(stream, one_row_per_ind=Config.ONE_ROW_PER_IND)
+    # The parsed data is at its largest, and still alive
+    profiler.checkpoint()
+
+    with recorder.measure("runs"):
+        runs = execute_runs(
+            job.create_runs(), job.input_file, data.n_loci,
+            data.n_samples, (mainparams, extraparams), reference,
+            recorder)
+    if job.is_canceled():
+        return job.update_status(Job.Status.Canceled)
+    if any(run.status != Job.Status.Complete for run in runs):
+        raise ValueError("Unexpected execution error")
+    with recorder.measure("collect"):
+        job.best_k = best_k(job.evanno())
+        best = max(
+            [run for run in runs if run.param_k == job.best_k],
+            key=lambda run: run.ln_prob)
+        shutil.copyfile(best.output_file, job.output_file)
+        shutil.copyfile(best.log_file, job.log_file)
+        shutil.copyfile(best.q_file, job.q_file)
+        job.compress_artifacts()
+    job.update_status(Job.Status.Complete)
+    job.store_in_cache()
+
+
+def _project_job(job, data, reference, recorder):
+    import numpy as np
+    from .io import QFile
+    from .projection import project, project_reference, write_output
+    if reference is None:
+        raise ValueError("Projection requires a reference panel")
+    # The samples are matched against the panel index, never merged with it
+    index = reference.index
+    job.n_samples = data.n_samples + reference.genotype.n_samples
+    job.n_loci = index.n_loci + index.n_unknown(data.loci)
+    with recorder.measure("project"):
+        projection = project(data, index)
+        panel = project_reference(reference)
+    with recorder.measure("collect"):
+        job.param_k = job.best_k = len(reference.groups)
+        with open(job.output_file, "w") as stream:
+            write_output(stream, data.samples, projection, reference.groups)
+        with open(job.log_file, "w") as stream:
+            stream.write(
+                "Projected %d samples on %d loci of the `%s` panel, %d EM "
+                "then %d Newton iterations\n" % (
+                    data.n_samples, projection.n_loci, job.param_reference,
+                    projection.em_iter, projection.newton_iter))
+        qfile = QFile.from_arrays(
+            reference.genotype.samples + data.samples,
+            np.concatenate([panel.q, projection.q]))
+        qfile.summarise(reference.groups, reference.ranges)
+        with open(job.q_file, "w") as stream:
+            qfile.write(stream)
+        job.compress_artifacts()
+    job.update_status(Job.Status.Complete)
+    job.store_in_cache()
@@ -0,0 +1,36 @@
+import os
+import gzip
+import shutil
+
+from flask import request, send_file, abort
+
+COMPRESSED_EXT = ".gz"
+BUFFER_SIZE = 1024 * 1024
+
+
+def compress(path, level=6):
+    staging = path + COMPRESSED_EXT + ".tmp"
+    with open(path, "rb") as source, \
+            gzip.open(staging, "wb", compresslevel=level) as dest:
+        shutil.copyfileobj(source, dest, BUFFER_SIZE)
+    os.replace(staging, path + COMPRESSED_EXT)
+    return path + COMPRESSED_EXT
+
+
+def accepts_gzip():
+    return request.accept_encodings["gzip"] > 0
+
+
+def send_artifact(path, mimetype):
+    # Files are sent by path, so uwsgi can hand them to its offload threads.
+    # `conditional` adds ETag/Last-Modified validators, 304s and Ranges.
+    if not os.path.isfile(path):
+        return abort(404)
+    compressed = path + COMPRESSED_EXT
+    if accepts_gzip() and os.path.isfile(compressed):
+        response = send_file(compressed, mimetype=mimetype, conditional=True)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True)
+    response.vary.add("Accept-Encoding")
+    return response
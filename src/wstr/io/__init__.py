@@ -1,15 +1,49 @@
-from os.path import join
+from os.path import join, getmtime
 
 from .genotype import Genotype
-from .reference import Reference
+from .matrix import GenotypeMatrix
+from .reference import Reference, MATRIX_EXT
+from .index import AlleleIndex
 from .qfile import QFile
+from .validate import validate
+
+STD_REFERENCES = dict(
+    ancestry=dict(
+        source="ancestry.str",
+        format="str",
+        groups=["European", "Nat. American", "African"],
+        sizes=[290, 246, 200])
+)
+
+
+def parse_std_reference(resources, name):
+    spec = STD_REFERENCES[name]
+    stream = open(join(resources, spec["source"]))
+    return Reference(
+        GenotypeMatrix.parse_file(stream, spec["format"]),
+        groups=spec["groups"],
+        sizes=spec["sizes"])
+
+
+def load_std_reference(resources, name):
+    # Prefer the compiled panel, unless its source changed after compiling
+    source = join(resources, STD_REFERENCES[name]["source"])
+    compiled = join(resources, name)
+    if (Reference.is_compiled(compiled) and
+            getmtime(compiled + MATRIX_EXT) >= getmtime(source)):
+        return Reference.load(compiled)
+    return parse_std_reference(resources, name)
+
+
+def compile_std_references(resources, dest=None):
+    dest = resources if dest is None else dest
+    for name in STD_REFERENCES:
+        parse_std_reference(resources, name).save(join(dest, name))
+    return list(STD_REFERENCES)
 
 
 def get_std_references(resources):
-    ancestry_stream = open(join(resources, "ancestry.str"))
-    return dict(
-        ancestry=Reference(
-            Genotype.parse_file(ancestry_stream, "str"),
-            groups=["European", "Nat. American", "African"],
-            sizes=[290, 246, 200])
-    )
+    return {
+        name: load_std_reference(resources, name)
+        for name in STD_REFERENCES
+    }
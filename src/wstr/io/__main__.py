@@ -0,0 +1,14 @@
+import argparse
+
+from . import compile_std_references
+
+parser = argparse.ArgumentParser(
+    prog="python -m wstr.io",
+    description="Compile the standard reference panels into binary files")
+parser.add_argument("resources", help="folder with the reference sources")
+parser.add_argument("--dest", help="output folder (defaults to resources)")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    for name in compile_std_references(args.resources, args.dest):
+        print("Compiled reference `%s`" % name)
@@ -1,6 +1,7 @@
 from sortedcontainers import SortedSet
 
 FORMAT_DELIMITER = dict(csv=",", txt="\t", tsv="\t")
+BLOCK_SIZE = 512
 FIX_LOCUS = dict(
     MID675="MID675", MDI1391="MID1391",
     MDI1785="MID1785", MID1636="MID1632")
@@ -18,14 +19,23 @@ def _sanitize_name(name):
 
 def _sanitize_genotype(geno):
     geno = geno.strip()
-    if len(geno) == 2:
-        return (geno[0], geno[1])
-    elif geno == "-9" or geno == "":
+    if geno == "-9" or geno == "":
         return ("-9", "-9")
+    elif len(geno) == 2:
+        return (geno[0], geno[1])
     else:
         raise ValueError("Invalid genotype format")
 
 
+def _format_sample(sample, first, second, one_row_per_ind=False):
+    if one_row_per_ind:
+        alleles = [allele for pair in zip(first, second) for allele in pair]
+        return sample + " " + " ".join(alleles) + "\n"
+    return (
+        sample + " " + " ".join(first) + "\n" +
+        sample + " " + " ".join(second) + "\n")
+
+
 class Genotype(object):
     def __init__(self):
         self._samples = []
@@ -33,7 +43,8 @@ class Genotype(object):
         self._data = dict()
 
     def add_loci(self, loci):
-        self._loci = self._loci.union(loci)
+        if not self._loci.issuperset(loci):
+            self._loci = self._loci.union(loci)
         return self
 
     def add(self, sample, loci, genotype):
@@ -75,20 +86,20 @@ class Genotype(object):
             raise KeyError()
         return self._data[sample].get(loci, ("-9", "-9"))
 
-    def write(self, stream):
-        print("", " ".join(self.loci), file=stream)
+    def write(self, stream, one_row_per_ind=False):
+        loci = list(self.loci)
+        stream.write(" " + " ".join(loci) + "\n")
+        missing = ("-9", "-9")
+        block = []
         for sample, geno in self:
-            line0 = [sample]
-            line1 = [sample]
-            for locus in self.loci:
-                if locus not in geno:
-                    line0.append("-9")
-                    line1.append("-9")
-                    continue
-                line0.append(geno[locus][0])
-                line1.append(geno[locus][1])
-            print(" ".join(line0), file=stream)
-            print(" ".join(line1), file=stream)
+            pairs = [geno.get(locus, missing) for locus in loci]
+            block.append(_format_sample(
+                sample, [p[0] for p in pairs], [p[1] for p in pairs],
+                one_row_per_ind))
+            if len(block) == BLOCK_SIZE:
+                stream.write("".join(block))
+                block = []
+        stream.write("".join(block))
 
     def __iter__(self):
         for sample in self._samples:
@@ -0,0 +1,130 @@
+import numpy as np
+
+from .matrix import GenotypeMatrix, MISSING
+
+
+class AlleleIndex(object):
+    # Allele counts of a reference panel, per locus and per group of samples,
+    # with the locus -> column map of its (sorted) loci. Codes follow the
+    # allele tables of the panel, `n_alleles[j]` being the "other allele"
+    # code of locus j in `translate` and `frequencies`.
+    def __init__(self, loci, alleles, counts, missing):
+        if counts.shape[0] != len(loci) or missing.shape != (
+                counts.shape[0], counts.shape[2]):
+            raise ValueError("Inconsistent loci and counts shape")
+        self._loci = list(loci)
+        self._columns = {locus: j for j, locus in enumerate(self._loci)}
+        self._alleles = [list(a) for a in alleles]
+        self._codes = [
+            {allele: code for code, allele in enumerate(a)}
+            for a in self._alleles
+        ]
+        self.n_alleles = np.array(
+            [len(a) for a in self._alleles], dtype=np.intp)
+        self.counts = counts  # (loci x alleles x groups)
+        self.missing = missing  # (loci x groups) missing allele copies
+        self._frequencies = dict()
+
+    @property
+    def loci(self):
+        return self._loci
+
+    @property
+    def columns(self):
+        return self._columns
+
+    @property
+    def n_loci(self):
+        return len(self._loci)
+
+    @property
+    def n_groups(self):
+        return self.counts.shape[2]
+
+    @property
+    def totals(self):
+        # (loci x groups) observed allele copies
+        return self.counts.sum(axis=1)
+
+    @property
+    def missing_rate(self):
+        copies = self.totals + self.missing
+        return np.divide(
+            self.missing, copies, out=np.zeros(self.missing.shape),
+            where=copies > 0)
+
+    def alleles(self, locus):
+        return self._alleles[self._columns[locus]]
+
+    def column(self, loci):
+        # Columns of the given loci, -1 for those not in the panel
+        return np.array(
+            [self._columns.get(locus, -1) for locus in loci], dtype=np.intp)
+
+    def n_unknown(self, loci):
+        return sum(1 for locus in loci if locus not in self._columns)
+
+    def frequencies(self, pseudocount=0.0):
+        # (loci x alleles + 1 x groups), the last allele slot standing for
+        # any allele the panel doesn't have. A pseudocount is the posterior
+        # mean under a symmetric Dirichlet prior, so that unseen alleles
+        # don't get a null frequency. Kept, as every job asks for the same.
+        if pseudocount in self._frequencies:
+            return self._frequencies[pseudocount]
+        n_loci, width, n_groups = self.counts.shape
+        counts = np.zeros((n_loci, width + 1, n_groups))
+        counts[:, :width] = self.counts
+        slots = np.arange(width + 1)[np.newaxis, :] <= \
+            self.n_alleles[:, np.newaxis]
+        counts += pseudocount * slots[:, :, np.newaxis]
+        totals = counts.sum(axis=1, keepdims=True)
+        freqs = np.divide(
+            counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+        freqs.setflags(write=False)
+        self._frequencies[pseudocount] = freqs
+        return freqs
+
+    def translate(self, genotype):
+        # The loci `genotype` shares with the panel, as (columns, matrix):
+        # the panel columns and a (samples x columns x 2) matrix of the
+        # panel allele codes (or `n_alleles` for alleles it doesn't have)
+        genotype = _as_matrix(genotype)
+        columns = self.column(genotype.loci)
+        shared = np.nonzero(columns >= 0)[0]
+        source = genotype.matrix
+        matrix = np.full(
+            (genotype.n_samples, len(shared), 2), MISSING, dtype=np.int16)
+        for i, j in enumerate(shared.tolist()):
+            column = columns[j]
+            codes = self._codes[column]
+            other = self.n_alleles[column]
+            table = np.array(
+                [codes.get(a, other) for a in genotype.allele_tables[j]] +
+                [MISSING], dtype=np.int16)
+            matrix[:, i] = table[source[:, j]]
+        return columns[shared], matrix
+
+    @classmethod
+    def build(cls, genotype, ranges):
+        genotype = _as_matrix(genotype)
+        matrix = genotype.matrix
+        n_loci = genotype.n_loci
+        n_alleles = [len(a) for a in genotype.allele_tables]
+        width = max(n_alleles + [1])
+        counts = np.zeros((n_loci, width, len(ranges)), dtype=np.int64)
+        missing = np.zeros((n_loci, len(ranges)), dtype=np.int64)
+        offsets = np.arange(n_loci)[:, np.newaxis] * width
+        for k, (start, stop) in enumerate(ranges):
+            codes = matrix[start:stop].transpose(1, 0, 2).reshape(n_loci, -1)
+            observed = codes != MISSING
+            index = (offsets + codes.astype(np.intp))[observed]
+            counts[:, :, k] = np.bincount(
+                index, minlength=n_loci * width).reshape(n_loci, width)
+            missing[:, k] = (~observed).sum(axis=1)
+        return cls(genotype.loci, genotype.allele_tables, counts, missing)
+
+
+def _as_matrix(genotype):
+    if isinstance(genotype, GenotypeMatrix):
+        return genotype
+    return GenotypeMatrix().merge(genotype)
@@ -0,0 +1,329 @@
+import numpy as np
+
+from sortedcontainers import SortedSet
+from .genotype import Genotype, FORMAT_DELIMITER, BLOCK_SIZE
+from .genotype import _sanitize_locus, _sanitize_name, _format_sample
+
+MISSING = -1
+MISSING_ALLELE = "-9"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _is_missing(allele):
+    return allele is None or allele == "" or allele == MISSING_ALLELE
+
+
+def _read_lines(stream, chunk_size=CHUNK_SIZE):
+    if not hasattr(stream, "read"):
+        for line in stream:
+            yield line.rstrip("\r\n")
+        return
+    rest = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    if rest != "":
+        yield rest.rstrip("\r")
+
+
+def _check_width(rows, width):
+    for row in rows:
+        if len(row) != width:
+            raise ValueError("Inconsistent loci and genotype sizes")
+
+
+def _split_genotypes(tokens):
+    tokens = np.char.strip(np.array(tokens, dtype=str))
+    missing = (tokens == "") | (tokens == MISSING_ALLELE)
+    if np.any(~missing & (np.char.str_len(tokens) != 2)):
+        raise ValueError("Invalid genotype format")
+    alleles = tokens.astype("U2").view("U1").reshape(tokens.shape + (2,))
+    alleles[missing] = ""
+    return alleles
+
+
+def _str_blocks(lines, block_size=BLOCK_SIZE):
+    header = next(lines, None)
+    if header is None:
+        return
+    loci = [_sanitize_locus(l) for l in header.split()]
+    samples, rows = [], []
+    for line0 in lines:
+        if line0.strip() == "":
+            continue
+        line1 = next(lines, None)
+        if line1 is None:
+            break
+        name, *gen0 = line0.split()
+        samples.append(_sanitize_name(name))
+        rows.append((gen0, line1.split()[1:]))
+        if len(rows) == block_size:
+            yield loci, samples, _str_alleles(rows, len(loci))
+            samples, rows = [], []
+    if len(rows) > 0:
+        yield loci, samples, _str_alleles(rows, len(loci))
+
+
+def _str_alleles(rows, width):
+    _check_width([row for pair in rows for row in pair], width)
+    alleles = np.array(rows, dtype=str).reshape(len(rows), 2, width)
+    return alleles.transpose(0, 2, 1)
+
+
+def _delim_blocks(lines, delimiter=None, block_size=BLOCK_SIZE):
+    header = next(lines, None)
+    if header is None:
+        return
+    loci = [_sanitize_locus(l) for l in header.split(delimiter)[1:]]
+    samples, rows = [], []
+    for line in lines:
+        if line.strip() == "":
+            continue
+        name, *geno = line.split(delimiter)
+        samples.append(_sanitize_name(name))
+        rows.append(geno)
+        if len(rows) == block_size:
+            _check_width(rows, len(loci))
+            yield loci, samples, _split_genotypes(rows)
+            samples, rows = [], []
+    if len(rows) > 0:
+        _check_width(rows, len(loci))
+        yield loci, samples, _split_genotypes(rows)
+
+
+def _blocks(stream, format="txt", block_size=BLOCK_SIZE):
+    lines = _read_lines(stream)
+    if format == "str":
+        return _str_blocks(lines, block_size)
+    elif format in FORMAT_DELIMITER:
+        return _delim_blocks(lines, FORMAT_DELIMITER[format], block_size)
+    else:
+        raise ValueError("Invalid file format")
+
+
+class GenotypeMatrix(Genotype):
+    # Columnar alternative to `Genotype`: alleles are stored as small integer
+    # codes in a (samples x loci x 2) matrix, with one allele table per locus.
+    # Columns are kept in the same (sorted) order as `loci`.
+    def __init__(self, dtype=np.int8):
+        self._samples = []
+        self._index = dict()
+        self._loci = SortedSet([])
+        self._alleles = []
+        self._codes = []
+        self._matrix = np.full((0, 0, 2), MISSING, dtype=dtype)
+
+    def _reserve(self, n_rows):
+        capacity = self._matrix.shape[0]
+        if n_rows <= capacity:
+            return
+        capacity = max(n_rows, 2 * capacity, 16)
+        matrix = np.full(
+            (capacity, self._matrix.shape[1], 2), MISSING,
+            dtype=self._matrix.dtype)
+        matrix[:self.n_samples] = self._matrix[:self.n_samples]
+        self._matrix = matrix
+
+    def _encode(self, column, allele):
+        if _is_missing(allele):
+            return MISSING
+        codes = self._codes[column]
+        if allele not in codes:
+            codes[allele] = len(self._alleles[column])
+            self._alleles[column].append(allele)
+            if codes[allele] > np.iinfo(self._matrix.dtype).max:
+                self._matrix = self._matrix.astype(np.int16)
+        return codes[allele]
+
+    def _translation(self, column, alleles):
+        # Maps foreign allele codes into this matrix codes; the trailing
+        # entry catches MISSING (-1) when used as a lookup table.
+        table = [self._encode(column, str(a)) for a in alleles]
+        return np.array(table + [MISSING], dtype=np.int16)
+
+    def add_loci(self, loci):
+        if self._loci.issuperset(loci):
+            return self
+        loci = self._loci.union(loci)
+        keep = np.array([loci.index(l) for l in self._loci], dtype=np.intp)
+        matrix = np.full(
+            (self._matrix.shape[0], len(loci), 2), MISSING,
+            dtype=self._matrix.dtype)
+        alleles = [[] for _ in loci]
+        codes = [dict() for _ in loci]
+        if len(keep) > 0:
+            matrix[:, keep] = self._matrix
+            for i, j in enumerate(keep):
+                alleles[j] = self._alleles[i]
+                codes[j] = self._codes[i]
+        self._loci = loci
+        self._matrix = matrix
+        self._alleles = alleles
+        self._codes = codes
+        return self
+
+    def add(self, sample, loci, genotype):
+        if len(loci) != len(genotype):
+            raise ValueError("Inconsistent loci and genotype sizes")
+        self.add_loci(loci)
+        row = self.n_samples
+        self._reserve(row + 1)
+        for locus, geno in zip(loci, genotype):
+            column = self._loci.index(locus)
+            first = self._encode(column, str(geno[0]))
+            second = self._encode(column, str(geno[1]))
+            self._matrix[row, column] = (first, second)
+        self._samples.append(sample)
+        self._index[sample] = row
+        return self
+
+    def add_block(self, samples, loci, alleles):
+        alleles = np.asarray(alleles, dtype=str)
+        if alleles.shape != (len(samples), len(loci), 2):
+            raise ValueError("Inconsistent loci and genotype sizes")
+        self.add_loci(loci)
+        start, size = self.n_samples, len(samples)
+        self._reserve(start + size)
+        for j, locus in enumerate(loci):
+            column = self._loci.index(locus)
+            values, inverse = np.unique(alleles[:, j], return_inverse=True)
+            table = self._translation(column, values)
+            self._matrix[start:start + size, column] = \
+                table[inverse].reshape(size, 2)
+        for i, sample in enumerate(samples):
+            self._samples.append(sample)
+            self._index[sample] = start + i
+        return self
+
+    def merge(self, other):
+        if not isinstance(other, Genotype):
+            raise ValueError("Must be of type `Genotype` to merge")
+        if not isinstance(other, GenotypeMatrix):
+            for sample, geno in other:
+                loci = list(geno.keys())
+                self.add(sample, loci, [geno[l] for l in loci])
+            return self
+        self.add_loci(other.loci)
+        start, size = self.n_samples, other.n_samples
+        self._reserve(start + size)
+        source = other.matrix
+        for j, locus in enumerate(other.loci):
+            column = self._loci.index(locus)
+            table = self._translation(column, other._alleles[j])
+            self._matrix[start:start + size, column] = table[source[:, j]]
+        for i, sample in enumerate(other.samples):
+            self._samples.append(sample)
+            self._index[sample] = start + i
+        return self
+
+    @property
+    def matrix(self):
+        return self._matrix[:self.n_samples]
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    @property
+    def allele_tables(self):
+        return self._alleles
+
+    def alleles(self, locus):
+        return self._alleles[self._loci.index(locus)]
+
+    def get(self, sample, loci):
+        if (sample not in self._index) or (loci not in self._loci):
+            raise KeyError()
+        column = self._loci.index(loci)
+        first, second = self._matrix[self._index[sample], column]
+        if first == MISSING or second == MISSING:
+            return (MISSING_ALLELE, MISSING_ALLELE)
+        alleles = self._alleles[column]
+        return (alleles[first], alleles[second])
+
+    def decode(self, start=0, stop=None):
+        # Allele strings for every cell, using one lookup over a flat table
+        # built from the per-locus allele tables.
+        table = [a for alleles in self._alleles for a in alleles]
+        table.append(MISSING_ALLELE)
+        table = np.array(table, dtype=object)
+        offsets = np.cumsum([0] + [len(a) for a in self._alleles[:-1]])
+        matrix = self.matrix[start:stop].astype(np.intp)
+        index = np.where(
+            matrix == MISSING, len(table) - 1,
+            matrix + offsets[np.newaxis, :, np.newaxis])
+        return table[index]
+
+    def write(self, stream, one_row_per_ind=False):
+        stream.write(" " + " ".join(self.loci) + "\n")
+        for start in range(0, self.n_samples, BLOCK_SIZE):
+            values = self.decode(start, start + BLOCK_SIZE)
+            samples = self._samples[start:start + BLOCK_SIZE]
+            if one_row_per_ind:
+                # Rows of the (loci x 2) block are already interleaved
+                lines = [
+                    sample + " " + " ".join(values[i].ravel().tolist()) + "\n"
+                    for i, sample in enumerate(samples)
+                ]
+            else:
+                lines = [
+                    _format_sample(
+                        sample, values[i, :, 0].tolist(),
+                        values[i, :, 1].tolist())
+                    for i, sample in enumerate(samples)
+                ]
+            stream.write("".join(lines))
+
+    def __iter__(self):
+        values = self.decode()
+        for i, sample in enumerate(self._samples):
+            yield sample, {
+                locus: (values[i, j, 0], values[i, j, 1])
+                for j, locus in enumerate(self._loci)
+            }
+
+    @classmethod
+    def from_arrays(cls, samples, loci, alleles, matrix):
+        if matrix.shape != (len(samples), len(loci), 2):
+            raise ValueError("Inconsistent matrix shape")
+        if len(alleles) != len(loci):
+            raise ValueError("Inconsistent loci and alleles sizes")
+        genotype = cls(dtype=matrix.dtype)
+        genotype._samples = list(samples)
+        genotype._index = {sample: i for i, sample in enumerate(samples)}
+        genotype._loci = SortedSet(loci)
+        if list(genotype._loci) != list(loci):
+            raise ValueError("Loci must be sorted and unique")
+        genotype._alleles = [list(a) for a in alleles]
+        genotype._codes = [
+            {allele: code for code, allele in enumerate(a)}
+            for a in genotype._alleles
+        ]
+        genotype._matrix = matrix
+        return genotype
+
+    @classmethod
+    def iter_blocks(cls, stream, format="txt", block_size=BLOCK_SIZE):
+        for loci, samples, alleles in _blocks(stream, format, block_size):
+            yield cls().add_block(samples, loci, alleles)
+
+    @classmethod
+    def parse_str(cls, stream, block_size=BLOCK_SIZE):
+        genotype = cls()
+        for loci, samples, alleles in _str_blocks(
+                _read_lines(stream), block_size):
+            genotype.add_block(samples, loci, alleles)
+        return genotype
+
+    @classmethod
+    def parse_delim(cls, stream, delimiter=None, block_size=BLOCK_SIZE):
+        genotype = cls()
+        for loci, samples, alleles in _delim_blocks(
+                _read_lines(stream), delimiter, block_size):
+            genotype.add_block(samples, loci, alleles)
+        return genotype
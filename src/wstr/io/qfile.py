@@ -1,57 +1,80 @@
-from statistics import mean
+import numpy as np
+
+REDUCERS = dict(mean=np.mean, median=np.median, min=np.min, max=np.max)
+
+
+def _reducer(func):
+    if isinstance(func, str):
+        if func not in REDUCERS:
+            raise ValueError("Unknown reducer `%s`" % func)
+        return REDUCERS[func]
+    return func
+
 
 class QFile (object):
+    # Ancestries are kept in a contiguous (samples x ancestries) float matrix
     def __init__(self):
         self._samples = []
-        self._data = None
+        self._data = np.zeros((0, 0))
         self._n = 0
-    
+
+    def _reserve(self, n_rows):
+        capacity = self._data.shape[0]
+        if n_rows <= capacity:
+            return
+        data = np.zeros((max(n_rows, 2 * capacity, 16), self._n))
+        data[:self.n_samples] = self.matrix
+        self._data = data
+
     def add(self, name, ancestry):
         if self._n == 0:
             self._n = len(ancestry)
-            self._data = [[] for _ in range(self._n)]
+            self._data = np.zeros((0, self._n))
         elif self._n != len(ancestry):
             raise ValueError()
 
+        self._reserve(self.n_samples + 1)
+        self._data[self.n_samples] = ancestry
         self._samples.append(name)
-        for i in range(self._n):
-            self._data[i].append(ancestry[i])
 
     def write(self, stream):
-        for sample, genotype in self:
-            print(sample, *genotype, sep="\t", file=stream)
+        line = "%s" + "\t%.12g" * self._n + "\n"
+        stream.write("".join(
+            line % (sample, *ancestry) for sample, ancestry in self))
 
     def to_barplot(self):
-        if self._data is None:
+        if self._n == 0:
             return []
         names = self._samples
         return [
-            dict(x=names, y=self._data[i], type="bar", name="Pop #%03d" % i)
+            dict(x=names, y=self.matrix[:, i].tolist(), type="bar",
+                 name="Pop #%03d" % i)
             for i in range(self.n_ancestries)
         ]
 
-    def summarise(self, labels, ranges, func=mean):
-        to_exclude = set([])
-        for j in range(len(labels)):
-            rg = ranges[j]
-            to_exclude = to_exclude.union(list(range(*rg)))
-            ancestry = [
-                func(self._data[i][rg[0]:rg[1]])
-                for i in range(self.n_ancestries)
-            ]
-            self.add(labels[j], ancestry)
-        new_data = [[] for _ in range(self.n_ancestries)]
-        new_sample = []
-        for i in range(self.n_samples):
-            if i in to_exclude:
-                continue
-            new_sample.append(self._samples[i])
-            for j in range(self.n_ancestries):
-                new_data[j].append(self._data[j][i])
-        self._data = new_data
-        self._samples = new_sample
+    def aggregate(self, ranges, func="mean"):
+        func = _reducer(func)
+        matrix = self.matrix
+        return np.array([
+            func(matrix[start:stop], axis=0) for start, stop in ranges
+        ]).reshape(len(ranges), self._n)
+
+    def summarise(self, labels, ranges, func="mean"):
+        if len(labels) != len(ranges):
+            raise ValueError("Inconsistent labels and ranges length")
+        groups = self.aggregate(ranges, func)
+        keep = np.ones(self.n_samples, dtype=bool)
+        for start, stop in ranges:
+            keep[start:stop] = False
+        samples = [s for s, k in zip(self._samples, keep.tolist()) if k]
+        self._data = np.concatenate([self.matrix[keep], groups])
+        self._samples = samples + list(labels)
         return self
 
+    @property
+    def matrix(self):
+        return self._data[:self.n_samples]
+
     @property
     def samples(self):
         return self._samples
@@ -67,18 +90,40 @@ class QFile (object):
     def get_ancestry(self, i):
         if i >= self._n:
             raise IndexError()
-        return self._data[i]
+        return self.matrix[:, i].tolist()
+
+    def row(self, i):
+        return self.matrix[i]
+
+    def __getitem__(self, key):
+        # qfile[rows] or qfile[rows, ancestries], returning a new QFile
+        rows, columns = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(rows, (int, np.integer)):
+            rows = slice(rows, rows + 1 if rows != -1 else None)
+        samples = np.array(self._samples, dtype=object)[rows].tolist()
+        matrix = self.matrix[rows]
+        return QFile.from_arrays(samples, matrix[:, columns])
 
     def __iter__(self):
-        for i in range(self.n_samples):
-            yield (
-                self._samples[i],
-                [self._data[j][i] for j in range(self.n_ancestries)]
-            )
+        for sample, ancestry in zip(self._samples, self.matrix.tolist()):
+            yield sample, ancestry
 
     @classmethod
-    def parse(cls, stream):
+    def from_arrays(cls, samples, matrix):
+        matrix = np.array(matrix, dtype=float)
+        if len(samples) == 0:
+            return cls()
+        if matrix.ndim != 2 or matrix.shape[0] != len(samples):
+            raise ValueError("Inconsistent samples and ancestry sizes")
         qfile = cls()
+        qfile._samples = list(samples)
+        qfile._data = matrix
+        qfile._n = matrix.shape[1]
+        return qfile
+
+    @classmethod
+    def parse(cls, stream):
+        samples, ancestries = [], []
         # Skip until ancestry table
         while not next(stream).startswith("Inferred ancestry"):
             pass
@@ -88,19 +133,17 @@ class QFile (object):
             values = line.rstrip().split()
             if len(values) == 0:
                 break
-            name = values[1]
-            ancestry = [float(v) for v in values[4:]]
-            qfile.add(name, ancestry)
+            samples.append(values[1])
+            ancestries.append([float(v) for v in values[4:]])
             # Move to next line
-            line = next(stream)
-        return qfile
+            line = next(stream, "")
+        return cls.from_arrays(samples, ancestries)
 
     @classmethod
     def open(cls, stream):
-        qfile = cls()
+        samples, ancestries = [], []
         for line in stream:
             values = line.rstrip().split("\t")
-            name = values[0]
-            ancestry = [float(v) for v in values[1:]]
-            qfile.add(name, ancestry)
-        return qfile
\ No newline at end of file
+            samples.append(values[0])
+            ancestries.append([float(v) for v in values[1:]])
+        return cls.from_arrays(samples, ancestries)
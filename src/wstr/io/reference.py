@@ -1,15 +1,33 @@
+import os
+import json
+
+import numpy as np
+
+from .matrix import GenotypeMatrix
+from .index import AlleleIndex
+
+MATRIX_EXT = ".npy"
+META_EXT = ".json"
+INDEX_EXT = ".index.npz"
+
+
 class Reference(object):
-    def __init__(self, genotype, groups, sizes):
+    def __init__(self, genotype, groups, sizes, index=None):
         if len(groups) != len(sizes):
             raise ValueError("Inconsistent group and sizes length")
         self._genotype = genotype
         self._groups = groups
+        self._sizes = sizes
         self._ranges = []
         to_skip = 0
         maximum = self._genotype.n_samples
         for size in sizes:
             self._ranges.append((to_skip, min(to_skip + size, maximum)))
             to_skip += size
+        # Built once per panel, jobs only look it up
+        if index is None:
+            index = AlleleIndex.build(genotype, self._ranges)
+        self._index = index
 
     @property
     def genotype(self):
@@ -19,6 +37,60 @@ class Reference(object):
     def groups(self):
         return self._groups
 
+    @property
+    def sizes(self):
+        return self._sizes
+
     @property
     def ranges(self):
         return self._ranges
+
+    @property
+    def index(self):
+        return self._index
+
+    def save(self, path):
+        genotype = self._genotype
+        if not isinstance(genotype, GenotypeMatrix):
+            genotype = GenotypeMatrix().merge(genotype)
+        meta = dict(
+            samples=genotype.samples,
+            loci=list(genotype.loci),
+            alleles=genotype.allele_tables,
+            groups=self._groups,
+            sizes=self._sizes)
+        # Write to temporary files first so readers never see partial panels
+        with open(path + MATRIX_EXT + ".tmp", "wb") as stream:
+            np.save(stream, np.ascontiguousarray(genotype.matrix))
+        with open(path + META_EXT + ".tmp", "w") as stream:
+            json.dump(meta, stream)
+        with open(path + INDEX_EXT + ".tmp", "wb") as stream:
+            np.savez(
+                stream, counts=self._index.counts,
+                missing=self._index.missing)
+        os.replace(path + MATRIX_EXT + ".tmp", path + MATRIX_EXT)
+        os.replace(path + META_EXT + ".tmp", path + META_EXT)
+        os.replace(path + INDEX_EXT + ".tmp", path + INDEX_EXT)
+        return self
+
+    @classmethod
+    def is_compiled(cls, path):
+        return (
+            os.path.isfile(path + MATRIX_EXT) and
+            os.path.isfile(path + META_EXT))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(path + META_EXT, "r") as stream:
+            meta = json.load(stream)
+        matrix = np.load(path + MATRIX_EXT, mmap_mode="r" if mmap else None)
+        genotype = GenotypeMatrix.from_arrays(
+            meta["samples"], meta["loci"], meta["alleles"], matrix)
+        index = None
+        # Panels compiled before the index existed get it built here
+        if os.path.isfile(path + INDEX_EXT):
+            with np.load(path + INDEX_EXT) as arrays:
+                index = AlleleIndex(
+                    meta["loci"], meta["alleles"], arrays["counts"],
+                    arrays["missing"])
+        return cls(genotype, meta["groups"], meta["sizes"], index)
@@ -0,0 +1,247 @@
+import json
+import hashlib
+import itertools
+import numpy as np
+
+from collections import namedtuple
+from .genotype import FORMAT_DELIMITER, BLOCK_SIZE
+from .genotype import _sanitize_locus, _sanitize_name
+from .matrix import _read_lines, MISSING_ALLELE
+
+MAX_ISSUES = 50
+
+# `line` and `column` are 1-based positions in the file, or None
+Issue = namedtuple("Issue", ["line", "column", "message"])
+
+
+class Report(object):
+    # Errors prevent the file from being processed, warnings don't. Only the
+    # first `max_issues` of each are kept, but all of them are counted.
+    def __init__(self, max_issues=MAX_ISSUES):
+        self._max_issues = max_issues
+        self.errors = []
+        self.warnings = []
+        self.n_errors = 0
+        self.n_warnings = 0
+        self.n_samples = 0
+        self.n_loci = 0
+        self.loci = []
+        self.digest = None
+
+    def error(self, line, column, message):
+        self.errors_from([(line, column, message)], 1)
+
+    def warning(self, line, column, message):
+        self.warnings_from([(line, column, message)], 1)
+
+    def errors_from(self, issues, count):
+        # `issues` is only consumed up to the cap, `count` is their total
+        room = self._max_issues - len(self.errors)
+        self.errors.extend(Issue(*i) for i in itertools.islice(issues, room))
+        self.n_errors += count
+
+    def warnings_from(self, issues, count):
+        room = self._max_issues - len(self.warnings)
+        self.warnings.extend(Issue(*i) for i in itertools.islice(issues, room))
+        self.n_warnings += count
+
+    def sort(self):
+        def key(issue):
+            return (issue.line or 0, issue.column or 0)
+        self.errors.sort(key=key)
+        self.warnings.sort(key=key)
+        return self
+
+    @property
+    def ok(self):
+        return self.n_errors == 0
+
+    def to_dict(self):
+        return dict(
+            errors=[i._asdict() for i in self.errors],
+            warnings=[i._asdict() for i in self.warnings],
+            n_errors=self.n_errors,
+            n_warnings=self.n_warnings,
+            n_samples=self.n_samples,
+            n_loci=self.n_loci,
+            digest=self.digest)
+
+    def save(self, path):
+        with open(path, "w") as stream:
+            json.dump(self.to_dict(), stream)
+        return path
+
+
+class InvalidGenotypeError(ValueError):
+    def __init__(self, report, filename=None):
+        message = format_issue(report.errors[0])
+        if filename is not None:
+            message = "%s: %s" % (filename, message)
+        super(InvalidGenotypeError, self).__init__(message)
+        self.report = report
+        self.filename = filename
+
+
+def format_issue(issue):
+    if issue.line is None:
+        return issue.message
+    if issue.column is None:
+        return "Line %d: %s" % (issue.line, issue.message)
+    return "Line %d, column %d: %s" % (issue.line, issue.column, issue.message)
+
+
+def _samples(lines, format, delimiter, width, report):
+    # Yields (line numbers, sample, rows of genotype tokens), one row per
+    # line of the sample. Ragged samples are reported and skipped.
+    rows = 2 if format == "str" else 1
+    for number, line in lines:
+        if line.strip() == "":
+            continue
+        sample = [(number, line)]
+        while len(sample) < rows:
+            number, line = next(lines, (None, None))
+            if line is None:
+                report.error(
+                    sample[0][0], None, "Missing second line of sample")
+                return
+            sample.append((number, line))
+        fields = [line.split(delimiter) for _, line in sample]
+        names = set(_sanitize_name(f[0].strip()) for f in fields)
+        if len(names) > 1:
+            report.error(sample[1][0], 1, "Sample name differs from line %d"
+                         % sample[0][0])
+            continue
+        ragged = False
+        for (number, _), row in zip(sample, fields):
+            if len(row) - 1 != width:
+                ragged = True
+                report.error(number, None, "Expected %d genotypes, found %d"
+                             % (width, len(row) - 1))
+        if not ragged:
+            yield ([n for n, _ in sample], names.pop(),
+                   [row[1:] for row in fields])
+
+
+def _check_block(report, format, numbers, tokens):
+    # tokens: (samples x rows x loci) genotype strings
+    tokens = np.char.strip(tokens)
+    missing = (tokens == "") | (tokens == MISSING_ALLELE)
+    if format == "str":
+        invalid = ~missing & ~np.char.isdigit(tokens)
+    else:
+        invalid = ~missing & (np.char.str_len(tokens) != 2)
+    cells = np.nonzero(invalid)
+    if len(cells[0]) > 0:
+        report.errors_from((
+            (numbers[i][k], j + 2, "Invalid genotype `%s`" % tokens[i, k, j])
+            for i, k, j in zip(*(c.tolist() for c in cells))
+        ), len(cells[0]))
+    return missing.any(axis=1)
+
+
+def _digest_block(digest, format, samples, tokens, order):
+    # Same lines as `GenotypeMatrix.write` of the parsed file: loci sorted,
+    # one line per allele copy and missing alleles as -9
+    tokens = np.char.strip(tokens[:, :, order])
+    missing = (tokens == "") | (tokens == MISSING_ALLELE)
+    if format == "str":
+        alleles = np.where(missing, MISSING_ALLELE, tokens)
+    else:
+        pairs = np.ascontiguousarray(tokens[:, 0].astype("U2"))
+        pairs = pairs.view("U1").reshape(pairs.shape + (2,))
+        alleles = np.where(
+            missing[:, 0, :, np.newaxis], MISSING_ALLELE, pairs)
+        alleles = alleles.transpose(0, 2, 1)
+    digest.update("".join(
+        sample + " " + " ".join(alleles[i, k].tolist()) + "\n"
+        for i, sample in enumerate(samples) for k in range(2)
+    ).encode("utf-8"))
+
+
+def validate(stream, format="txt", loci=None, max_missing_sample=0.5,
+             max_missing_locus=0.5, max_issues=MAX_ISSUES,
+             block_size=BLOCK_SIZE):
+    # Checks a whole genotype file in blocks of samples. Unknown loci (when
+    # compared to the `loci` of a reference panel) and missingness above the
+    # given rates are warnings.
+    report = Report(max_issues)
+    if format != "str" and format not in FORMAT_DELIMITER:
+        report.error(None, None, "Invalid file format")
+        return report
+    delimiter = None if format == "str" else FORMAT_DELIMITER[format]
+    lines = enumerate(_read_lines(stream), 1)
+    _, header = next(lines, (None, None))
+    if header is None:
+        report.error(None, None, "Empty file")
+        return report
+
+    names = header.split(delimiter)
+    header = [_sanitize_locus(l.strip()) for l in
+              (names if format == "str" else names[1:])]
+    report.loci = header
+    report.n_loci = width = len(header)
+    if width == 0:
+        report.error(1, None, "No locus found in header")
+    seen = dict()
+    for j, locus in enumerate(header):
+        if locus in seen:
+            report.error(1, j + 2, "Duplicate locus `%s`, first in column %d"
+                         % (locus, seen[locus] + 2))
+        seen[locus] = j
+    if loci is not None:
+        unknown = [(j, l) for j, l in enumerate(header) if l not in loci]
+        report.warnings_from((
+            (1, j + 2, "Locus `%s` isn't part of the reference panel" % l)
+            for j, l in unknown
+        ), len(unknown))
+
+    # Digest of the normalized genotype, so that the same data in another
+    # format, line ending or locus order shares cached results
+    order = sorted(range(width), key=header.__getitem__)
+    digest = hashlib.sha256(
+        (" " + " ".join(sorted(header)) + "\n").encode("utf-8"))
+    first_line = dict()
+    missing_loci = np.zeros(width, dtype=np.int64)
+    samples = _samples(lines, format, delimiter, width, report)
+    while True:
+        block = list(itertools.islice(samples, block_size))
+        if len(block) == 0:
+            break
+        for numbers, sample, _ in block:
+            if sample in first_line:
+                report.error(numbers[0], 1, "Duplicate sample `%s`, first on "
+                             "line %d" % (sample, first_line[sample]))
+            else:
+                first_line[sample] = numbers[0]
+        numbers = [b[0] for b in block]
+        tokens = np.array([b[2] for b in block], dtype=str).reshape(
+            len(block), len(numbers[0]), width)
+        missing = _check_block(report, format, numbers, tokens)
+        if report.ok:
+            _digest_block(digest, format, [b[1] for b in block], tokens, order)
+        missing_loci += missing.sum(axis=0)
+        report.n_samples += len(block)
+        if width == 0:
+            continue
+        rates = missing.mean(axis=1)
+        above = np.nonzero(rates > max_missing_sample)[0].tolist()
+        report.warnings_from((
+            (block[i][0][0], None, "Sample `%s` is missing %d%% of its "
+             "genotypes" % (block[i][1], round(100 * rates[i])))
+            for i in above
+        ), len(above))
+
+    if report.n_samples == 0:
+        if report.ok:
+            report.error(None, None, "No sample found")
+        return report.sort()
+    rates = missing_loci / report.n_samples
+    above = np.nonzero(rates > max_missing_locus)[0].tolist()
+    report.warnings_from((
+        (1, j + 2, "Locus `%s` is missing in %d%% of the samples"
+         % (header[j], round(100 * rates[j])))
+        for j in above
+    ), len(above))
+    if report.ok:
+        report.digest = digest.hexdigest()
+    return report.sort()
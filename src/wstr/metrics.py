@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import bisect
+import threading
+
+# Upper bounds in seconds, Prometheus adds +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.01, 0.1, 1, 10, 60, 300, 900, 3600)
+JOB_BUCKETS = (1, 10, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n") \
+        .replace('"', r'\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (key, _escape(value)) for key, value in labels)
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float) and value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_metric(name, type, help, samples):
+    # `samples` are (suffix, labels, value), labels being (key, value) pairs
+    lines = ["# HELP %s %s" % (name, help), "# TYPE %s %s" % (name, type)]
+    lines.extend(
+        "%s%s%s %s" % (name, suffix, _format_labels(labels),
+                       _format_value(value))
+        for suffix, labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+def histogram_samples(labels, buckets, cumulative, count, total):
+    # `cumulative[i]` is the number of observations <= `buckets[i]`
+    labels = tuple(labels)
+    for bound, value in zip(buckets, cumulative):
+        yield "_bucket", labels + (("le", _format_value(float(bound))),), value
+    yield "_bucket", labels + (("le", "+Inf"),), count
+    yield "_sum", labels, float(total)
+    yield "_count", labels, count
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative(self):
+        counts, running = [], 0
+        for value in self.counts[:-1]:
+            running += value
+            counts.append(running)
+        return counts
+
+    def merge(self, counts, total):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.total += total
+
+
+class ProcessHistograms(object):
+    # Histograms of the current process, by label. They are flushed to a file
+    # of `root` at most every `interval` seconds, so that any process (e.g.
+    # one uwsgi worker answering a scrape) can sum those of all the others.
+    def __init__(self, root, buckets, interval=5):
+        self.root = root
+        self.buckets = tuple(buckets)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._histograms = dict()
+        self._flushed_at = time.monotonic()
+
+    def observe(self, label, value):
+        with self._lock:
+            if os.getpid() != self._pid:  # Forked since, start afresh
+                self._reset()
+            histogram = self._histograms.get(label)
+            if histogram is None:
+                histogram = self._histograms[label] = Histogram(self.buckets)
+            histogram.observe(value)
+        if time.monotonic() - self._flushed_at > self.interval:
+            self.flush()
+
+    @property
+    def path(self):
+        return os.path.join(self.root, "%d.json" % os.getpid())
+
+    def flush(self):
+        with self._lock:
+            if os.getpid() != self._pid or len(self._histograms) == 0:
+                return
+            state = {
+                label: dict(counts=h.counts, total=h.total)
+                for label, h in self._histograms.items()
+            }
+            self._flushed_at = time.monotonic()
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as stream:
+            json.dump(state, stream)
+        os.replace(tmp, self.path)
+
+    def collect(self):
+        # Sums the files of all processes, this one's being flushed first
+        self.flush()
+        histograms = dict()
+        names = os.listdir(self.root) if os.path.isdir(self.root) else []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.root, name)) as stream:
+                    state = json.load(stream)
+            except (OSError, ValueError):  # Replaced while reading
+                continue
+            for label, value in state.items():
+                if len(value["counts"]) != len(self.buckets) + 1:
+                    continue  # Written with other buckets
+                if label not in histograms:
+                    histograms[label] = Histogram(self.buckets)
+                histograms[label].merge(value["counts"], value["total"])
+        return histograms
+
+    def clear(self):
+        # At startup, as pids of a previous instance may be reused
+        with self._lock:
+            self._reset()
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                os.remove(os.path.join(self.root, name))
@@ -0,0 +1,91 @@
+import os
+import time
+import datetime
+
+from flask import Blueprint, Response, request, g
+from .config import Config
+from .db import Job, queue_time, run_time, stage_time, spooler_processes
+from .metrics import ProcessHistograms, format_metric, histogram_samples
+from .metrics import LATENCY_BUCKETS
+
+monitor = Blueprint("monitor", __name__)
+# Request latencies of every worker, summed at scrape time
+request_latency = ProcessHistograms(
+    os.path.join(Config.METRICS_DIR, "request"), LATENCY_BUCKETS,
+    Config.METRICS_FLUSH_INTERVAL)
+ALL_HISTOGRAMS = [request_latency, queue_time, run_time, stage_time]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Finished jobs are counted by `wstr_job_run_seconds`, without any scan
+ACTIVE = [Job.Status.Queued, Job.Status.Running]
+
+
+@monitor.before_app_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@monitor.teardown_app_request
+def _observe_latency(exc):
+    start = g.pop("request_start", None)
+    if start is not None:
+        request_latency.observe(
+            request.endpoint or "unknown", time.perf_counter() - start)
+
+
+def histogram_metric(name, help, label, histograms):
+    samples = []
+    for value, h in sorted(histograms.collect().items()):
+        labels = [] if label is None else [(label, value)]
+        samples.extend(histogram_samples(
+            labels, histograms.buckets, h.cumulative(), h.count, h.total))
+    return format_metric(name, "histogram", help, samples)
+
+
+def job_metrics():
+    counts = Job.count_by_status(ACTIVE)
+    busy = counts[Job.Status.Running]
+    spoolers = spooler_processes()
+    oldest = Job.select(Job.created_at) \
+        .where(Job.status == Job.Status.Queued) \
+        .order_by(Job.created_at).first()
+    waiting = 0.0 if oldest is None else \
+        (datetime.datetime.now() - oldest.created_at).total_seconds()
+    yield format_metric(
+        "wstr_jobs", "gauge", "Number of queued and running jobs.",
+        [("", [("status", status.name)], count)
+         for status, count in counts.items()])
+    yield format_metric(
+        "wstr_queue_oldest_seconds", "gauge",
+        "Time the oldest queued job has been waiting.", [("", [], waiting)])
+    yield format_metric(
+        "wstr_spooler_processes", "gauge", "Number of spooler processes.",
+        [("", [], spoolers)])
+    yield format_metric(
+        "wstr_spooler_busy", "gauge", "Number of spoolers running a job.",
+        [("", [], busy)])
+    yield format_metric(
+        "wstr_spooler_utilization", "gauge",
+        "Fraction of the spooler processes running a job.",
+        [("", [], busy / spoolers)])
+    yield histogram_metric(
+        "wstr_job_queue_seconds", "Time jobs waited before running.",
+        None, queue_time)
+    yield histogram_metric(
+        "wstr_job_run_seconds", "Time jobs ran for, by final status.",
+        "status", run_time)
+    yield histogram_metric(
+        "wstr_stage_seconds", "Wall time of job and run stages.",
+        "stage", stage_time)
+
+
+def request_metrics():
+    yield histogram_metric(
+        "wstr_request_seconds", "Latency of the requests, by view.",
+        "view", request_latency)
+
+
+@monitor.route("/metrics", methods=["GET"])
+def metrics():
+    body = "".join(list(job_metrics()) + list(request_metrics()))
+    return Response(body, content_type=CONTENT_TYPE)
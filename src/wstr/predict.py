@@ -0,0 +1,60 @@
+import numpy as np
+
+# Below this many past jobs, only the median cost per unit of work is used
+MIN_HISTORY = 10
+
+
+def run_load(k_values, replicates, n_worker):
+    # STRUCTURE time grows about linearly with K, and the runs of a job share
+    # `n_worker` threads
+    n_runs = len(k_values) * replicates
+    return sum(k_values) * replicates / min(n_runs, n_worker)
+
+
+def _design(n_samples, n_loci, load):
+    n_samples, n_loci, load = np.broadcast_arrays(
+        np.asarray(n_samples, dtype=float), np.asarray(n_loci, dtype=float),
+        np.asarray(load, dtype=float))
+    return np.column_stack([
+        np.ones(n_samples.size), np.log(n_samples.ravel()),
+        np.log(n_loci.ravel()), np.log(load.ravel())])
+
+
+class RuntimePredictor(object):
+    # Log-linear model of the duration of a job (in seconds):
+    #   log(t) = a + b log(N) + c log(L) + d log(load)
+    # fitted by least squares on past jobs
+    def __init__(self):
+        self._coef = None
+        self._ratio = None
+        self.n_jobs = 0
+
+    def fit(self, n_samples, n_loci, loads, durations):
+        n_samples = np.asarray(n_samples, dtype=float)
+        n_loci = np.asarray(n_loci, dtype=float)
+        loads = np.asarray(loads, dtype=float)
+        durations = np.asarray(durations, dtype=float)
+        valid = (n_samples > 0) & (n_loci > 0) & (loads > 0) & (durations > 0)
+        n_samples, n_loci = n_samples[valid], n_loci[valid]
+        loads, durations = loads[valid], durations[valid]
+        self.n_jobs = int(valid.sum())
+        self._coef = self._ratio = None
+        if self.n_jobs == 0:
+            return self
+        self._ratio = float(np.median(durations / (n_samples * n_loci * loads)))
+        if self.n_jobs >= MIN_HISTORY:
+            self._coef, _, _, _ = np.linalg.lstsq(
+                _design(n_samples, n_loci, loads), np.log(durations),
+                rcond=None)
+        return self
+
+    @property
+    def fitted(self):
+        return self._ratio is not None
+
+    def predict(self, n_samples, n_loci, load):
+        if not self.fitted or min(n_samples, n_loci, load) <= 0:
+            return None
+        if self._coef is None:
+            return n_samples * n_loci * load * self._ratio
+        return float(np.exp(_design(n_samples, n_loci, load) @ self._coef)[0])
@@ -0,0 +1,76 @@
+import cProfile
+import tracemalloc
+
+TOP_ALLOCATIONS = 25
+TRACEBACK_DEPTH = 10
+
+
+class Profiler(object):
+    # cProfile of the current thread and tracemalloc of the whole process,
+    # from `__enter__` to `__exit__`. Saves the profile (for pstats or
+    # snakeviz) and a report of the largest allocations, as found by the
+    # `checkpoint` using the most memory. Does nothing unless `enabled`.
+    def __init__(self, prof_file, alloc_file, enabled=True,
+                 top=TOP_ALLOCATIONS):
+        self.prof_file = prof_file
+        self.alloc_file = alloc_file
+        self.enabled = enabled
+        self.top = top
+        self._profile = cProfile.Profile() if enabled else None
+        self._tracing = False
+        self._snapshot = None
+        self._snapshot_size = -1
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        # Someone else (e.g. PYTHONTRACEMALLOC) may already be tracing
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start(TRACEBACK_DEPTH)
+        elif hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+            # Otherwise the peak may predate the job
+            tracemalloc.reset_peak()
+        self._profile.enable()
+        return self
+
+    def checkpoint(self):
+        # Keeps a snapshot of the allocations if more memory is in use than
+        # at the previous checkpoints
+        if not self.enabled or not tracemalloc.is_tracing():
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self._snapshot_size:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._snapshot_size = current
+
+    def __exit__(self, *exc):
+        if not self.enabled:
+            return False
+        self._profile.disable()
+        self.checkpoint()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._tracing:
+            tracemalloc.stop()
+        self._profile.dump_stats(self.prof_file)
+        with open(self.alloc_file, "w") as stream:
+            write_allocations(
+                stream, self._snapshot, self._snapshot_size, peak, self.top)
+        self._snapshot = None
+        return False
+
+
+def write_allocations(stream, snapshot, current, peak, top=TOP_ALLOCATIONS):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    stats = snapshot.statistics("traceback")
+    stream.write("Peak traced memory: %.1f MiB\n" % (peak / 2 ** 20))
+    stream.write("Top %d allocations alive at the largest checkpoint "
+                 "(%.1f MiB):\n" % (min(top, len(stats)), current / 2 ** 20))
+    for rank, stat in enumerate(stats[:top], 1):
+        stream.write("\n#%d: %.1f KiB in %d blocks\n"
+                     % (rank, stat.size / 1024, stat.count))
+        for line in stat.traceback.format():
+            stream.write(line + "\n")
@@ -0,0 +1,169 @@
+import numpy as np
+
+from functools import lru_cache
+from collections import namedtuple
+from .io.matrix import MISSING
+
+PSEUDOCOUNT = 0.5
+MAX_ITER = 100
+EM_ITER = 5
+MAX_HALVING = 30
+TOLERANCE = 1e-8
+BLOCK_SIZE = 256
+
+# `q`: (samples x groups) admixture proportions, `ln_prob`: log likelihood
+# of each sample, `missing`: fraction of its alleles missing, `em_iter`
+# and `newton_iter`: steps of either method (the most any sample took)
+Projection = namedtuple(
+    "Projection",
+    ["q", "ln_prob", "missing", "em_iter", "newton_iter", "n_loci"])
+
+
+def _em_step(likelihood, weights, q):
+    mix = likelihood * q[:, np.newaxis, :]
+    posterior = mix / mix.sum(axis=2, keepdims=True)
+    return np.einsum("ic,ick->ik", weights, posterior)
+
+
+def _ln_prob(likelihood, observed, q):
+    mix = (likelihood * q[:, np.newaxis, :]).sum(axis=2)
+    return np.where(observed, np.log(mix), 0.0).sum(axis=1)
+
+
+def _newton_step(likelihood, weight, q, free):
+    # Newton direction of the log likelihood restricted to the `free`
+    # proportions and to sum(q) = 1, from the KKT system
+    #   [H 1; 1' 0] [d; -mu] = [-g; 0]
+    # where fixed proportions get d = 0. `mu` is the common gradient of the
+    # free proportions at the optimum.
+    n_samples, _, n_groups = likelihood.shape
+    mix = (likelihood * q[:, np.newaxis, :]).sum(axis=2)
+    ratio = likelihood / mix[..., np.newaxis] * weight
+    gradient = ratio.sum(axis=1)
+    system = np.zeros((n_samples, n_groups + 1, n_groups + 1))
+    system[:, :n_groups, :n_groups] = \
+        -np.einsum("ick,icl->ikl", ratio, ratio) - 1e-9 * np.eye(n_groups)
+    system[:, :n_groups, n_groups] = 1
+    system[:, n_groups, :n_groups] = free
+    rhs = np.zeros((n_samples, n_groups + 1))
+    rhs[:, :n_groups] = -gradient
+    rows, columns = np.nonzero(~free)
+    system[rows, columns] = 0
+    system[rows, columns, columns] = 1
+    rhs[rows, columns] = 0
+    solution = np.linalg.solve(system, rhs[..., np.newaxis])[..., 0]
+    return solution[:, :n_groups], gradient, -solution[:, n_groups]
+
+
+def admixture(matrix, freqs, max_iter=MAX_ITER, tol=TOLERANCE,
+              em_iter=EM_ITER):
+    # Maximum likelihood admixture proportions of each sample of a
+    # (samples x loci x 2) matrix, with fixed (loci x alleles x groups)
+    # frequencies: every allele copy comes from group k with probability
+    # q[k], then from that group's frequencies. EM gets close from uniform
+    # proportions, but crawls once some of them head to 0, so it is followed
+    # by an active set Newton method on the same (concave) likelihood.
+    n_samples, n_loci, _ = matrix.shape
+    n_groups = freqs.shape[2]
+    codes = matrix.reshape(n_samples, 2 * n_loci).astype(np.intp)
+    observed = codes != MISSING
+    loci = np.repeat(np.arange(n_loci), 2)[np.newaxis, :]
+    # (samples x copies x groups), missing copies weigh the same in every
+    # group so they don't move the estimate
+    likelihood = freqs[loci, np.where(observed, codes, 0)]
+    likelihood[~observed] = 1.0
+    n_observed = observed.sum(axis=1)
+    weight = observed[..., np.newaxis].astype(float)
+
+    q = np.full((n_samples, n_groups), 1.0 / n_groups)
+    weights = observed / np.maximum(n_observed, 1)[:, np.newaxis]
+    for _ in range(em_iter):
+        q = _em_step(likelihood, weights, q)
+
+    everyone = np.arange(n_samples)
+    free = np.ones((n_samples, n_groups), dtype=bool)
+    ln_prob = _ln_prob(likelihood, observed, q)
+    n_iter = 0
+    while n_iter < max_iter:
+        n_iter += 1
+        step, gradient, mu = _newton_step(likelihood, weight, q, free)
+        # Longest step keeping q >= 0, then halved until it improves
+        shrinking = free & (step < 0)
+        limit = np.where(shrinking, q / np.where(shrinking, -step, 1), np.inf)
+        longest = np.minimum(limit.min(axis=1), 1.0)
+        length = longest.copy()
+        for _ in range(MAX_HALVING):
+            update = np.clip(q + length[:, np.newaxis] * step, 0, None)
+            update_ln_prob = _ln_prob(likelihood, observed, update)
+            worse = update_ln_prob < ln_prob - 1e-12
+            if not worse.any():
+                break
+            length = np.where(worse, length / 2, length)
+        update /= update.sum(axis=1, keepdims=True)
+        change = np.abs(update - q).max(initial=0)
+        q, ln_prob = update, _ln_prob(likelihood, observed, update)
+        # Proportions stopping the step at 0 get fixed there, and the fixed
+        # one whose gradient most exceeds `mu` is freed again
+        blocked = free & (step < 0) & (q <= 1e-12) & \
+            ((length == longest) & (longest < 1))[:, np.newaxis]
+        gap = np.where(free, -np.inf, gradient - mu[:, np.newaxis])
+        worst = gap.argmax(axis=1)
+        release = np.zeros_like(free)
+        release[everyone, worst] = gap[everyone, worst] > 1e-9
+        free = (free & ~blocked) | release
+        q[~free] = 0
+        if change < tol and not blocked.any() and not release.any():
+            break
+    q[n_observed == 0] = 1.0 / n_groups
+    return q, ln_prob, n_iter
+
+
+def project(genotype, index, pseudocount=PSEUDOCOUNT, max_iter=MAX_ITER,
+            tol=TOLERANCE, em_iter=EM_ITER, block_size=BLOCK_SIZE):
+    # Supervised ancestry of every sample of `genotype`, on the allele
+    # frequencies of the groups of a reference panel (its `AlleleIndex`)
+    columns, matrix = index.translate(genotype)
+    # Loci without any reference genotype carry no information
+    informative = index.totals[columns].sum(axis=1) > 0
+    freqs = index.frequencies(pseudocount)[columns[informative]]
+    matrix = matrix[:, informative]
+
+    q = np.zeros((genotype.n_samples, index.n_groups))
+    ln_prob = np.zeros(genotype.n_samples)
+    newton_iter = 0
+    for start in range(0, genotype.n_samples, block_size):
+        stop = start + block_size
+        q[start:stop], ln_prob[start:stop], iterations = admixture(
+            matrix[start:stop], freqs, max_iter, tol, em_iter)
+        newton_iter = max(newton_iter, iterations)
+    missing = (matrix == MISSING).mean(axis=(1, 2)) if matrix.shape[1] > 0 \
+        else np.ones(genotype.n_samples)
+    return Projection(
+        q, ln_prob, missing, em_iter, newton_iter, int(informative.sum()))
+
+
+@lru_cache(maxsize=None)
+def project_reference(reference, pseudocount=PSEUDOCOUNT):
+    # Panels are loaded once per process, and so are their own samples
+    # projected, for the group rows of the Q files
+    return project(reference.genotype, reference.index, pseudocount)
+
+
+def write_output(stream, samples, projection, groups):
+    # Same layout as the ancestry table of STRUCTURE `_f` files, so
+    # `QFile.parse` and `parse_likelihood` read it alike
+    stream.write("Supervised projection on reference allele frequencies\n")
+    stream.write("Groups: %s\n" % ", ".join(groups))
+    stream.write("Informative loci: %d\n" % projection.n_loci)
+    stream.write("EM iterations: %d\n" % projection.em_iter)
+    stream.write("Newton iterations: %d\n\n" % projection.newton_iter)
+    stream.write("Estimated Ln Prob of Data   = %.1f\n\n"
+                 % projection.ln_prob.sum())
+    stream.write("Inferred ancestry of individuals:\n")
+    stream.write("        Label (%Miss) :  Inferred clusters\n")
+    for i, (sample, q, missing) in enumerate(
+            zip(samples, projection.q.tolist(), projection.missing.tolist())):
+        stream.write("%4d %s (%d) : %s\n" % (
+            i + 1, sample, round(100 * missing),
+            " ".join("%.3f" % value for value in q)))
+    stream.write("\n")
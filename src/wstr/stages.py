@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import datetime
+import resource
+import threading
+
+from collections import namedtuple
+
+# Per thread counters where available (Linux), so stages running in the run
+# threads don't account for each other
+RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+BLOCK_SIZE = 512  # Unit of ru_inblock/ru_oublock
+
+Usage = namedtuple(
+    "Usage",
+    ["wall_time", "cpu_time", "max_rss", "read_bytes", "write_bytes"])
+
+
+def _maxrss(rusage):
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    if sys.platform == "darwin":
+        return rusage.ru_maxrss
+    return rusage.ru_maxrss * 1024
+
+
+def usage_from_rusage(rusage, wall_time):
+    # e.g. the rusage of a child process, as returned by `os.wait4`
+    return Usage(
+        wall_time, rusage.ru_utime + rusage.ru_stime, _maxrss(rusage),
+        rusage.ru_inblock * BLOCK_SIZE, rusage.ru_oublock * BLOCK_SIZE)
+
+
+def exit_code(status):
+    # Same convention as `Popen.returncode`
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+Stage = namedtuple("Stage", ["name", "run", "started_at", "usage"])
+
+
+class StageRecorder(object):
+    # Collects stage timings of a job, from any thread, to be saved at once
+    def __init__(self):
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def add(self, name, started_at, usage, run=None):
+        with self._lock:
+            self.stages.append(Stage(name, run, started_at, usage))
+
+    def measure(self, name, run=None):
+        return _Measure(self, name, run)
+
+
+class _Measure(object):
+    # Wall time, CPU time and block I/O of the current thread over a stage.
+    # Peak RSS is the process high-water mark at the end of the stage.
+    def __init__(self, recorder, name, run):
+        self._recorder = recorder
+        self._name = name
+        self._run = run
+
+    def __enter__(self):
+        self._started_at = datetime.datetime.now()
+        self._start = time.perf_counter()
+        self._rusage = resource.getrusage(RUSAGE_THREAD)
+        return self
+
+    def __exit__(self, *exc):
+        wall_time = time.perf_counter() - self._start
+        end = resource.getrusage(RUSAGE_THREAD)
+        start = self._rusage
+        usage = Usage(
+            wall_time,
+            (end.ru_utime + end.ru_stime) - (start.ru_utime + start.ru_stime),
+            _maxrss(resource.getrusage(resource.RUSAGE_SELF)),
+            (end.ru_inblock - start.ru_inblock) * BLOCK_SIZE,
+            (end.ru_oublock - start.ru_oublock) * BLOCK_SIZE)
+        self._recorder.add(self._name, self._started_at, usage, self._run)
+        return False
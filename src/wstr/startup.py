@@ -0,0 +1,88 @@
+import re
+import sys
+import argparse
+import subprocess
+
+from collections import namedtuple
+from .config import Config
+
+# Parses the output of `python -X importtime` (or PYTHONPROFILEIMPORTTIME=1,
+# which also works for the interpreter embedded by uwsgi).
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)\s*$")
+
+ImportTime = namedtuple("ImportTime", ["module", "self", "cumulative", "depth"])
+
+
+def parse_importtime(stream):
+    timings = []
+    for line in stream:
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        timings.append(ImportTime(
+            module, int(self_us) / 1e6, int(cumulative_us) / 1e6,
+            (len(indent) - 1) // 2))
+    return timings
+
+
+def measure_imports(module, python=sys.executable):
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", "import %s" % module],
+        stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise RuntimeError("Unable to import `%s`:\n%s" % (module, proc.stderr))
+    return parse_importtime(proc.stderr.splitlines())
+
+
+def total_time(timings):
+    return sum(t.cumulative for t in timings if t.depth == 0)
+
+
+def by_package(timings):
+    packages = dict()
+    for timing in timings:
+        package = timing.module.split(".")[0]
+        packages[package] = packages.get(package, 0) + timing.self
+    return sorted(packages.items(), key=lambda item: -item[1])
+
+
+def report(timings, top=15, stream=sys.stdout):
+    print("Total import time: %.3fs" % total_time(timings), file=stream)
+    print("\nSlowest packages (self time):", file=stream)
+    for package, seconds in by_package(timings)[:top]:
+        print("  %8.3fs  %s" % (seconds, package), file=stream)
+    print("\nSlowest modules (cumulative time):", file=stream)
+    slowest = sorted(timings, key=lambda t: -t.cumulative)[:top]
+    for timing in slowest:
+        print("  %8.3fs  %s" % (timing.cumulative, timing.module), file=stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m wstr.startup",
+        description="Report import time per module at startup")
+    parser.add_argument(
+        "logfile", nargs="?",
+        help="importtime log to read, instead of importing `--module`")
+    parser.add_argument(
+        "-m", "--module", default="server", help="module to import")
+    parser.add_argument(
+        "-b", "--budget", type=float, default=Config.STARTUP_BUDGET,
+        help="fail when the total import time exceeds this many seconds")
+    parser.add_argument("-n", "--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    if args.logfile is None:
+        timings = measure_imports(args.module)
+    else:
+        timings = parse_importtime(open(args.logfile, "r"))
+    report(timings, args.top)
+    if total_time(timings) > args.budget:
+        print("\nStartup budget of %.3fs exceeded" % args.budget)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
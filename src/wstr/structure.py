@@ -0,0 +1,84 @@
+import re
+
+from statistics import mean, stdev
+
+BUFFER_SIZE = 1024 * 1024
+PARAM_LINE = re.compile(r"^(#define\s+)(\w+)(\s+)(\S+)(.*)$")
+
+
+def read_params(source):
+    params = dict()
+    with open(source, "r") as stream:
+        for line in stream:
+            match = PARAM_LINE.match(line.rstrip("\n"))
+            if match is not None:
+                params[match.group(2)] = match.group(4)
+    return params
+
+
+def write_params(source, dest, **overrides):
+    with open(source, "r") as stream, open(dest, "w") as out:
+        for line in stream:
+            match = PARAM_LINE.match(line.rstrip("\n"))
+            if match is not None and match.group(2) in overrides:
+                prefix, name, space, _, rest = match.groups()
+                line = "%s%s%s%s%s\n" % (
+                    prefix, name, space, overrides[name], rest)
+            out.write(line)
+    return dest
+
+
+def parse_likelihood(stream):
+    for line in stream:
+        if line.startswith("Estimated Ln Prob of Data"):
+            return float(line.split("=")[1])
+    raise ValueError("Missing estimated likelihood")
+
+
+def structure_command(binary, mainparams, extraparams, k, n_loci, n_samples,
+                      input_file, output_file, seed=None):
+    # STRUCTURE appends `_f` to the given output name
+    if output_file.endswith("_f"):
+        output_file = output_file[:-2]
+    cmd = [
+        binary,
+        "-m", mainparams,
+        "-e", extraparams,
+        "-K", str(k),
+        "-L", str(n_loci),
+        "-N", str(n_samples),
+        "-i", input_file,
+        "-o", output_file
+    ]
+    if seed is not None:
+        cmd += ["-D", str(seed)]
+    return cmd
+
+
+def evanno(likelihoods):
+    # Evanno et al. (2005) delta K from {K: [ln P(D) of each replicate]}
+    table = dict()
+    for k, values in likelihoods.items():
+        sd = stdev(values) if len(values) > 1 else 0.0
+        table[k] = dict(mean=mean(values), sd=sd, delta_k=None)
+    for k, values in likelihoods.items():
+        if (k - 1) not in likelihoods or (k + 1) not in likelihoods:
+            continue
+        if table[k]["sd"] == 0:
+            continue
+        second = [
+            abs(after - 2 * value + before)
+            for before, value, after in zip(
+                likelihoods[k - 1], values, likelihoods[k + 1])
+        ]
+        table[k]["delta_k"] = mean(second) / table[k]["sd"]
+    return table
+
+
+def best_k(table):
+    # Without replicates (or interior K) delta K is undefined, fall back to
+    # the highest mean likelihood
+    defined = [k for k in table if table[k]["delta_k"] is not None]
+    if len(defined) > 0:
+        return max(defined, key=lambda k: table[k]["delta_k"])
+    return max(table, key=lambda k: table[k]["mean"])
@@ -0,0 +1,167 @@
+import os
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from .config import Config
+from .archive import is_archive
+
+CHUNK_SIZE = 1024 * 1024
+MAX_LINE_SIZE = 1024 * 1024
+DELIMITERS = (b"\t", b",", b";")
+# As in `io.genotype`, as bytes for the sniffer. Importing `io` would load
+# numpy, which the sniffer doesn't need; the web worker still loads it when
+# `Job.validate` parses the upload and reference panel at submission.
+FORMAT_DELIMITER = dict(csv=b",", txt=b"\t", tsv=b"\t")
+
+
+class Sniffer(object):
+    # Checks the layout of a genotype file as its chunks go by: delimiter,
+    # number of loci and the number of fields of every line
+    def __init__(self, format):
+        self._format = format
+        self._rest = b""
+        self._width = None
+        self.line_no = 0
+        self.n_lines = 0
+        self.n_loci = None
+        self.delimiter = None
+        self.error = None
+
+    def feed(self, chunk):
+        if self.error is not None:
+            return
+        if b"\0" in chunk:
+            self.error = "Binary content"
+            return
+        lines = (self._rest + chunk).split(b"\n")
+        self._rest = lines.pop()
+        for line in lines:
+            self._line(line)
+        if len(self._rest) > MAX_LINE_SIZE:
+            self.error = "Line %d is too long" % (self.line_no + 1)
+
+    def close(self):
+        if self._rest != b"":
+            self._line(self._rest)
+            self._rest = b""
+        if self.error is not None:
+            return
+        if self.n_loci is None:
+            self.error = "Empty file"
+        elif self.n_loci == 0:
+            self.error = "No locus found in header"
+        elif self.n_lines == 0:
+            self.error = "No sample found"
+        elif self._format == "str" and self.n_lines % 2 != 0:
+            self.error = "Expected two lines per sample"
+
+    def _header(self, line):
+        if self._format == "str":
+            self.n_loci = len(line.split())
+            self._width = self.n_loci + 1
+            return
+        self.delimiter = max(DELIMITERS, key=line.count)
+        expected = FORMAT_DELIMITER[self._format]
+        if line.count(self.delimiter) == 0 or self.delimiter != expected:
+            self.error = "Header isn't delimited by %r" % expected.decode()
+            return
+        self.n_loci = line.count(self.delimiter)
+        self._width = self.n_loci + 1
+
+    def _line(self, line):
+        if self.error is not None:
+            return
+        self.line_no += 1
+        line = line.rstrip(b"\r")
+        if self.n_loci is None:
+            return self._header(line)
+        if line.strip() == b"":
+            return
+        self.n_lines += 1
+        if self.delimiter is None:
+            width = len(line.split())
+        else:
+            width = line.count(self.delimiter) + 1
+        if width != self._width:
+            self.error = "Line %d has %d fields, expected %d" % (
+                self.line_no, width, self._width)
+
+
+def sniffer_for(filename):
+    format = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if format != "str" and format not in FORMAT_DELIMITER:
+        return None
+    return Sniffer(format)
+
+
+class UploadSink(object):
+    # Writable file the multipart parser streams an upload into. Chunks go
+    # straight to disk, and are sniffed on the way.
+    def __init__(self, filename, max_size, root=None):
+        root = Config.UPLOAD_DIR if root is None else root
+        os.makedirs(root, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=root, suffix=".upload")
+        self._file = os.fdopen(fd, "w+b")
+        self._max_size = max_size
+        self.size = 0
+        self.sniffer = sniffer_for(filename)
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self._max_size:
+            # The parser gives up on the file without closing it
+            self.close()
+            raise RequestEntityTooLarge(
+                "Uploads are limited to %d bytes" % self._max_size)
+        if self.sniffer is not None:
+            self.sniffer.feed(chunk)
+        return self._file.write(chunk)
+
+    def __getattr__(self, name):
+        # read, readline, seek, tell... for the parser and archive readers
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    @property
+    def error(self):
+        if self.sniffer is None:
+            return None
+        self.sniffer.close()
+        return self.sniffer.error
+
+    def move(self, dest):
+        self._file.close()
+        os.replace(self.path, dest)
+        return dest
+
+    def close(self):
+        self._file.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def ingest(stream, filename, max_size, root=None):
+    # Copies e.g. an archive entry through a sink, enforcing its size limit
+    sink = UploadSink(filename, max_size, root)
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sink.write(chunk)
+    except RequestEntityTooLarge:
+        raise ValueError("`%s` exceeds %d bytes" % (filename, max_size))
+    sink.seek(0)
+    return sink
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        filename = filename or ""
+        if is_archive(filename):
+            return UploadSink(filename, Config.MAX_ARCHIVE_SIZE)
+        return UploadSink(filename, Config.MAX_UPLOAD_SIZE)
@@ -1,33 +1,78 @@
+import os
+import hmac
 import datetime
 
 from flask import Blueprint
-from flask import request, url_for, redirect, render_template, abort, send_file
-from .db import db, submit_job, Job
+from flask import request, url_for, redirect, render_template, abort
+from jinja2.utils import htmlsafe_json_dumps
+from .config import Config
+from .cache import LRUCache
+from .db import db, submit_job, submit_batch, Job, JobStage
+from .db import encode_cursor, decode_cursor
+from .archive import is_archive, iter_entries
+from .upload import UploadSink, ingest
+from .download import send_artifact
 from .name import generate_name
 
 ALLOWED_REF_PANEL = ["", "ancestry"]
 ALLOWED_EXTENSIONS = {"csv", "tsv", "txt", "str"}
 
 base = Blueprint("main", __name__)
+# Parsed Q files and barplot payloads of completed jobs, by (id, mtime)
+q_cache = LRUCache(Config.Q_CACHE_SIZE)
+# Validation reports of the jobs, by (id, mtime)
+validation_cache = LRUCache(Config.Q_CACHE_SIZE)
 
 
 # General task finder
-@base.before_request
+@base.before_app_request
 def _db_connect():
     db.connect(True)
 
 
-@base.teardown_request
+@base.teardown_app_request
 def _db_disconnect(exc):
     if not db.is_closed():
         db.close()
 
 
-def list_tasks():
+def is_admin():
+    token = request.headers.get("X-Admin-Token", "")
+    return Config.ADMIN_TOKEN != "" and hmac.compare_digest(
+        token.encode("utf-8"), Config.ADMIN_TOKEN.encode("utf-8"))
+
+
+def allowed_priorities():
+    return [
+        priority.name for priority in Job.Priority
+        if priority != Job.Priority.High or is_admin()
+    ]
+
+
+@base.context_processor
+def _priorities():
+    return dict(priorities={name: name for name in allowed_priorities()})
+
+
+def task_filters():
+    filters = dict(submitter=None, status=None, batch=None)
+    if request.args.get("submitter", "") != "":
+        filters["submitter"] = request.args["submitter"]
+    if request.args.get("status", "") in Job.Status.__members__:
+        filters["status"] = Job.Status[request.args["status"]]
+    if request.args.get("batch", "").isdigit():
+        filters["batch"] = int(request.args["batch"])
+    return filters
+
+
+def list_tasks(cursor=None, submitter=None, status=None, batch=None):
     last_week = datetime.datetime.today() - datetime.timedelta(days=7)
-    return Job.select()\
-        .where(Job.created_at > last_week)\
-        .order_by(Job.updated_at.desc())
+    tasks, next_cursor = Job.page(
+        since=last_week, submitter=submitter, status=status, batch=batch,
+        cursor=cursor, limit=Config.PAGE_SIZE)
+    total = Job.count_since(
+        last_week, submitter=submitter, status=status, batch=batch)
+    return tasks, encode_cursor(next_cursor), total
 
 
 def find_task(id):
@@ -37,6 +82,30 @@ def find_task(id):
     return task
 
 
+def task_results(task):
+    if task.status != Job.Status.Complete:
+        qfile = task.q()
+        return qfile, htmlsafe_json_dumps(qfile.to_barplot())
+    key = (task.id, os.path.getmtime(task.q_file))
+    results = q_cache.get(key)
+    if results is None:
+        qfile = task.q()
+        results = q_cache.put(
+            key, (qfile, htmlsafe_json_dumps(qfile.to_barplot())))
+    return results
+
+
+def task_validation(task):
+    try:
+        key = (task.id, os.path.getmtime(task.validation_file))
+    except OSError:
+        return None
+    validation = validation_cache.get(key)
+    if validation is None:
+        validation = validation_cache.put(key, task.validation())
+    return validation
+
+
 # Build task creation form
 def is_file_allowed(filename):
     return (
@@ -44,18 +113,33 @@ def is_file_allowed(filename):
         (filename.rstrip().split(".")[-1] in ALLOWED_EXTENSIONS))
 
 
+def upload_error(data):
+    # Format problems found while the upload was streamed in
+    if isinstance(data.stream, UploadSink):
+        return data.stream.error
+    return None
+
+
 def task_form():
-    form = dict(name='', submitter='', ref_panel='', n_pops=3, datafile=None)
+    form = dict(
+        name='', submitter='', ref_panel='', n_pops=3, n_pops_max='',
+        n_reps=1, seed='', priority='Normal', engine='Structure',
+        profile=False, datafile=None)
     errors = dict()
     return form, errors
 
 
-def update_task_form(form, errors):
+def update_params_form(form, errors):
     form["title"] = request.form["name"]
     form["submitter"] = request.form["submitter"]
     form["param_reference"] = request.form["ref_panel"]
     form["param_k"] = request.form["n_pops"]
-    form["data"] = request.files["datafile"]
+    form["param_k_max"] = request.form.get("n_pops_max", "")
+    form["param_replicates"] = request.form.get("n_reps", "1")
+    form["param_seed"] = request.form.get("seed", "")
+    form["priority"] = request.form.get("priority", "Normal")
+    form["engine"] = request.form.get("engine", "Structure")
+    form["profile"] = request.form.get("profile", "") != ""
     # Validate entry values
     if form["title"] == "":
         form["title"] = generate_name()
@@ -72,23 +156,133 @@ def update_task_form(form, errors):
             errors["n_pops"] = "Value must be below 12"
     except ValueError:
         errors["n_pops"] = "Value must be a valid number"
+    try:
+        if form["param_k_max"] == "":
+            form["param_k_max"] = None
+        else:
+            form["param_k_max"] = int(form["param_k_max"])
+            if form["param_k_max"] > 12:
+                errors["n_pops_max"] = "Value must be below 12"
+            if type(form["param_k"]) is int and \
+                    form["param_k_max"] < form["param_k"]:
+                errors["n_pops_max"] = "Value must be above K"
+    except ValueError:
+        errors["n_pops_max"] = "Value must be a valid number"
+    try:
+        form["param_replicates"] = int(form["param_replicates"])
+        if form["param_replicates"] < 1:
+            errors["n_reps"] = "Value must be above 1"
+        if form["param_replicates"] > Config.MAX_REPLICATES:
+            errors["n_reps"] = \
+                "Value must be below %d" % Config.MAX_REPLICATES
+    except ValueError:
+        errors["n_reps"] = "Value must be a valid number"
+    try:
+        if form["param_seed"] == "":
+            form["param_seed"] = Config.DEFAULT_SEED
+        form["param_seed"] = int(form["param_seed"])
+        if form["param_seed"] < 0:
+            errors["seed"] = "Value must be positive"
+    except ValueError:
+        errors["seed"] = "Value must be a valid number"
+    if form["priority"] in allowed_priorities():
+        form["priority"] = Job.Priority[form["priority"]]
+    else:
+        errors["priority"] = "Invalid priority"
+    if form["engine"] not in Job.Engine.__members__:
+        errors["engine"] = "Invalid engine"
+    else:
+        form["engine"] = Job.Engine[form["engine"]]
+        if form["engine"] == Job.Engine.Projection:
+            # K is the number of reference groups, and the result is exact
+            if form["param_reference"] == "":
+                errors["engine"] = "Projection requires a reference panel"
+            form["param_k_max"] = None
+            form["param_replicates"] = 1
+    return form, errors
+
+
+def update_task_form(form, errors):
+    update_params_form(form, errors)
+    form["data"] = request.files["datafile"]
     if form["data"].filename == '':
         errors["datafile"] = "Missing required field"
-    if not is_file_allowed(form["data"].filename):
+    elif not is_file_allowed(form["data"].filename):
         errors["datafile"] = "Invalid file extension"
+    elif upload_error(form["data"]) is not None:
+        errors["datafile"] = upload_error(form["data"])
     return form, errors
 
 
+def update_batch_form(form, errors):
+    update_params_form(form, errors)
+    form["data"] = [
+        data for data in request.files.getlist("datafile")
+        if data.filename != ""
+    ]
+    if len(form["data"]) == 0:
+        errors["datafile"] = "Missing required field"
+    for data in form["data"]:
+        if not (is_archive(data.filename) or is_file_allowed(data.filename)):
+            errors["datafile"] = "Invalid file extension"
+        elif upload_error(data) is not None:
+            errors["datafile"] = "%s: %s" % (data.filename, upload_error(data))
+    return form, errors
+
+
+def batch_entries(files):
+    for data in files:
+        if not is_archive(data.filename):
+            yield data.filename, data.stream
+            continue
+        entries = iter_entries(data.filename, data.stream, ALLOWED_EXTENSIONS)
+        for filename, entry in entries:
+            # Archive entries get the same limit and checks as uploads
+            upload = ingest(entry, filename, Config.MAX_UPLOAD_SIZE)
+            try:
+                if upload.error is not None:
+                    raise ValueError("%s: %s" % (filename, upload.error))
+                yield filename, upload
+            finally:
+                upload.close()
+
+
 # Add date formatter
 @base.app_template_filter("fmttime")
 def format_datetime(date, fmt="%d/%m %H:%M:%S"):
     return date.strftime(fmt)
 
 
+@base.app_template_filter("fmtduration")
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return "%ds" % seconds
+    if seconds < 60 * 60:
+        return "%dm %02ds" % divmod(seconds, 60)
+    return "%dh %02dm" % divmod(seconds // 60, 60)
+
+
 @base.route("/", methods=["GET"])
 def home():
-    tasks = list_tasks()
-    return render_template("home.j2", tasks=tasks)
+    filters = task_filters()
+    try:
+        cursor = decode_cursor(request.args["after"])
+    except (KeyError, ValueError):  # First page
+        cursor = None
+    tasks, next_cursor, total = list_tasks(cursor, **filters)
+    return render_template(
+        "home.j2", tasks=tasks, next_cursor=next_cursor, total=total,
+        filters=filters, statuses=list(Job.Status.__members__))
+
+
+@base.route("/stats", methods=["GET"])
+def stats():
+    days = request.args.get("days", 7, type=int)
+    since = datetime.datetime.today() - datetime.timedelta(days=days)
+    return render_template(
+        "stats.j2", days=days, jobs=Job.stats(since),
+        stages=JobStage.summary(since=since))
 
 
 @base.route("/add", methods=["GET"])
@@ -101,33 +295,82 @@ def add_task():
 def create_task():
     form, errors = task_form()
     update_task_form(form, errors)
+    report = None
     if len(errors) == 0:
-        task = submit_job(**form)
-        return redirect(url_for(".view_task", id=task.id))
-    return render_template("add.j2", task=form, error=errors)
+        try:
+            task = submit_job(**form)
+            return redirect(url_for(".view_task", id=task.id))
+        except ValueError as err:
+            # Validation errors come with a report of every issue found
+            errors["datafile"] = str(err)
+            report = getattr(err, "report", None)
+    return render_template("add.j2", task=form, error=errors, report=report)
+
+
+@base.route("/batch", methods=["GET"])
+def add_batch():
+    form, errors = task_form()
+    return render_template("batch.j2", task=form, error=errors)
+
+
+@base.route("/batch", methods=["POST"])
+def create_batch():
+    form, errors = task_form()
+    update_batch_form(form, errors)
+    report = None
+    if len(errors) == 0:
+        files = form.pop("data")
+        try:
+            batch = submit_batch(batch_entries(files), **form)
+            return redirect(url_for(".home", batch=batch.id))
+        except ValueError as err:
+            errors["datafile"] = str(err)
+            report = getattr(err, "report", None)
+    form["data"] = None
+    return render_template("batch.j2", task=form, error=errors, report=report)
 
 
 @base.route("/view/<int:id>", methods=["GET"])
 def view_task(id):
     task = find_task(id)
-    qfile = task.q()
-    plot = qfile.to_barplot()
-    return render_template("view.j2", task=task, barplot=plot, ancestry=qfile)
+    qfile, plot = task_results(task)
+    return render_template(
+        "view.j2", task=task, barplot=plot, ancestry=qfile,
+        validation=task_validation(task), stages=JobStage.summary(job=task))
+
+
+@base.route("/view/<int:id>/cancel", methods=["POST"])
+def cancel_task(id):
+    task = find_task(id)
+    task.cancel()
+    return redirect(url_for(".view_task", id=task.id))
 
 
 @base.route("/view/<int:id>.out", methods=["GET"])
 def download_task_out(id):
     task = find_task(id)
-    return send_file(task.output_file, "text/txt")
+    return send_artifact(task.output_file, "text/txt")
 
 
 @base.route("/view/<int:id>.log", methods=["GET"])
 def download_task_log(id):
     task = find_task(id)
-    return send_file(task.log_file, "text/txt")
+    return send_artifact(task.log_file, "text/txt")
 
 
 @base.route("/view/<int:id>.q", methods=["GET"])
 def download_task_q(id):
     task = find_task(id)
-    return send_file(task.q_file, "text/txt")
+    return send_artifact(task.q_file, "text/txt")
+
+
+@base.route("/view/<int:id>.prof", methods=["GET"])
+def download_task_profile(id):
+    task = find_task(id)
+    return send_artifact(task.profile_file, "application/octet-stream")
+
+
+@base.route("/view/<int:id>.alloc", methods=["GET"])
+def download_task_alloc(id):
+    task = find_task(id)
+    return send_artifact(task.alloc_file, "text/txt")
@@ -0,0 +1,65 @@
+import os
+import sys
+import types
+import shutil
+import atexit
+import tempfile
+
+import pytest
+
+# The spooler only exists inside uwsgi: spooled tasks are recorded here and
+# never run, the tests call `_execute_job` themselves when needed
+spooled = []
+
+
+def _spool(func):
+    def spool(args):
+        spooled.append(args)
+    spool.__name__ = func.__name__
+    return spool
+
+
+try:
+    import uwsgidecorators  # noqa: F401
+except ImportError:
+    sys.modules["uwsgidecorators"] = types.SimpleNamespace(spool=_spool)
+
+RESOURCE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resource")
+
+# App directory of the session, its work directory (database, uploads,
+# metrics) is created there and the resources are the repository's
+if "APP_PATH" not in os.environ:
+    os.environ["APP_PATH"] = tempfile.mkdtemp(prefix="wstr-test-")
+    os.symlink(RESOURCE, os.path.join(os.environ["APP_PATH"], "resource"))
+    atexit.register(shutil.rmtree, os.environ["APP_PATH"], True)
+
+
+@pytest.fixture
+def database(tmp_path):
+    from wstr.db import db
+    path = db.database
+    db.close_all()
+    db.database = str(tmp_path / "wstr.db")
+    yield db.database
+    db.close_all()
+    db.database = path
+
+
+@pytest.fixture
+def tables(database):
+    from wstr.db import db, create_tables
+    with db.connection_context():
+        create_tables()
+    db.connect(True)
+    del spooled[:]
+    yield database
+    db.close()
+
+
+@pytest.fixture
+def client(database):
+    from wstr import create_app
+    app = create_app()
+    del spooled[:]
+    return app.test_client()
@@ -0,0 +1,70 @@
+import datetime
+
+from wstr.db import Job
+
+
+def make_job(**kwargs):
+    fields = dict(
+        submitter="a", workdir="w", data_file="d", input_file="i",
+        output_file="o", log_file="l", q_file="q")
+    fields.update(kwargs)
+    return Job.create(**fields)
+
+
+def test_jobs_etag(client):
+    jobs = [make_job(), make_job()]
+    url = "/api/jobs?ids=%d,%d" % (jobs[0].id, jobs[1].id)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert [job["id"] for job in response.json["jobs"]] == \
+        [job.id for job in jobs]
+    assert response.json["next"] is None
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    # Any change to the jobs is a new version
+    jobs[1].update_status(Job.Status.Running)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["jobs"][1]["status"] == "Running"
+
+
+def test_jobs_since(client):
+    start = datetime.datetime(2024, 5, 1)
+    jobs = [make_job() for _ in range(3)]
+    # Same timestamp for all, the cursor resumes by id
+    Job.update(updated_at=start).execute()
+    response = client.get("/api/jobs?since=2024-04-30T00:00:00")
+    assert [job["id"] for job in response.json["jobs"]] == \
+        [job.id for job in jobs]
+    cursor = response.json["next"]
+
+    response = client.get("/api/jobs", query_string=dict(since=cursor))
+    assert response.json["jobs"] == []
+    assert response.json["next"] == cursor
+    jobs[0].update_status(Job.Status.Running)
+    response = client.get("/api/jobs", query_string=dict(since=cursor))
+    assert [job["id"] for job in response.json["jobs"]] == [jobs[0].id]
+    assert response.json["next"] != cursor
+
+    assert client.get("/api/jobs?since=yesterday").status_code == 400
+    assert client.get("/api/jobs?since=x,1").status_code == 400
+    assert client.get("/api/jobs").status_code == 400
+
+
+def test_cancel(client):
+    queued = make_job()
+    response = client.post("/api/jobs/%d/cancel" % queued.id)
+    assert response.status_code == 200
+    assert response.json["status"] == "Canceled"
+    # Finished jobs are left as they are
+    done = make_job()
+    done.update_status(Job.Status.Complete)
+    response = client.post("/api/jobs/%d/cancel" % done.id)
+    assert response.status_code == 200
+    assert response.json["status"] == "Complete"
+    assert Job.get_by_id(done.id).status == Job.Status.Complete
+    assert client.post("/api/jobs/%d/cancel" % 999).status_code == 404
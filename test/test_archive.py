@@ -0,0 +1,49 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from wstr.archive import is_archive, iter_entries
+
+EXTENSIONS = {"txt", "str"}
+
+
+def test_is_archive():
+    assert is_archive("plates.zip")
+    assert is_archive("plates.TAR.GZ")
+    assert not is_archive("plate.txt")
+
+
+def test_zip_entries():
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, "w") as archive:
+        archive.writestr("plates/a.txt", "A")
+        archive.writestr("plates/b.str", "B")
+        archive.writestr("plates/.hidden.txt", "C")
+        archive.writestr("README.md", "D")
+    stream.seek(0)
+    entries = [
+        (name, entry.read())
+        for name, entry in iter_entries("plates.zip", stream, EXTENSIONS)
+    ]
+    assert entries == [("a.txt", b"A"), ("b.str", b"B")]
+
+
+def test_tar_entries():
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode="w:gz") as archive:
+        for name, content in [("a.txt", b"A"), ("b.csv", b"B")]:
+            info = tarfile.TarInfo("plates/" + name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    stream.seek(0)
+    entries = [
+        (name, entry.read())
+        for name, entry in iter_entries("plates.tgz", stream, EXTENSIONS)
+    ]
+    assert entries == [("a.txt", b"A")]
+
+
+def test_invalid_archive():
+    with pytest.raises(ValueError):
+        list(iter_entries("plates.zip", io.BytesIO(b"garbage"), EXTENSIONS))
@@ -0,0 +1,103 @@
+import os
+import time
+
+from wstr import io
+from wstr.cache import ResultCache, LRUCache, genotype_digest, result_key
+
+CSV_STREAM = [
+    "S,B,A\n",
+    "X,12,11\n",
+]
+STR_STREAM = [
+    " A B\n",
+    "X 1 1\n",
+    "X 1 2\n",
+]
+
+
+def make_artifacts(folder, content):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, "qfile")
+    with open(path, "w") as stream:
+        stream.write(content)
+    return dict(qfile=path)
+
+
+def test_result_key_normalizes_genotype():
+    one = io.GenotypeMatrix.parse_file(iter(CSV_STREAM), "csv")
+    other = io.GenotypeMatrix.parse_file(iter(STR_STREAM), "str")
+    assert genotype_digest(one) == genotype_digest(other)
+    digest = genotype_digest(one)
+    assert result_key(digest, dict(k=3)) == result_key(digest, dict(k=3))
+    assert result_key(digest, dict(k=3)) != result_key(digest, dict(k=4))
+
+
+def test_store_and_fetch(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 1024, 60)
+    cache.store("abcd", make_artifacts(str(tmp_path / "a"), "A"), dict(x=1))
+
+    dest = str(tmp_path / "b")
+    os.mkdir(dest)
+    meta = cache.fetch("abcd", dict(qfile=os.path.join(dest, "qfile")))
+    assert meta == dict(x=1)
+    assert open(os.path.join(dest, "qfile")).read() == "A"
+    assert cache.fetch("ffff", dict(qfile=os.path.join(dest, "q2"))) is None
+
+
+def test_fetch_incomplete_entry(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 1024, 60)
+    cache.store("abcd", make_artifacts(str(tmp_path / "a"), "A"), dict(x=1))
+    dest = str(tmp_path / "b")
+    os.mkdir(dest)
+    artifacts = dict(
+        qfile=os.path.join(dest, "qfile"),
+        logfile=os.path.join(dest, "logfile"))
+    # Nothing linked, and the entry makes way for a complete one
+    assert cache.fetch("abcd", artifacts) is None
+    assert os.listdir(dest) == []
+    source = make_artifacts(str(tmp_path / "c"), "C")
+    source["logfile"] = source["qfile"]
+    cache.store("abcd", source, dict(x=2))
+    assert cache.fetch("abcd", artifacts) == dict(x=2)
+    assert open(artifacts["logfile"]).read() == "C"
+
+
+def test_fetch_failure_leaves_no_links(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 1024, 60)
+    source = make_artifacts(str(tmp_path / "a"), "A")
+    source["logfile"] = source["qfile"]
+    cache.store("abcd", source, dict(x=1))
+    dest = str(tmp_path / "b")
+    os.mkdir(dest)
+    artifacts = dict(
+        qfile=os.path.join(dest, "qfile"),
+        logfile=os.path.join(dest, "missing", "logfile"))
+    assert cache.fetch("abcd", artifacts) is None
+    assert os.listdir(dest) == []
+
+
+def test_evict_by_size_and_age(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 20, 60)
+    cache.store("aaaa", make_artifacts(str(tmp_path / "a"), "A" * 10), {})
+    old = time.time() - 10
+    os.utime(os.path.join(str(tmp_path / "cache"), "aa", "aaaa"), (old, old))
+    cache.store("bbbb", make_artifacts(str(tmp_path / "b"), "B" * 10), {})
+    # Least recently used entry goes first once over the size limit
+    assert not os.path.isdir(str(tmp_path / "cache" / "aa" / "aaaa"))
+    assert os.path.isdir(str(tmp_path / "cache" / "bb" / "bbbb"))
+
+    expired = ResultCache(str(tmp_path / "cache"), 1024, -1)
+    assert expired.fetch("bbbb", dict()) is None
+    assert not os.path.isdir(str(tmp_path / "cache" / "bb" / "bbbb"))
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    # `b` was the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
@@ -0,0 +1,260 @@
+import os
+import sys
+import sqlite3
+import datetime
+import subprocess
+
+import pytest
+from types import SimpleNamespace
+
+from wstr import db as models
+from wstr.db import db, create_tables, Job, JobStage
+from wstr.stages import Stage, Usage
+
+# Schema of the job table before batches, runs and stages
+BASELINE_SCHEMA = """
+CREATE TABLE "job" (
+    "id" INTEGER NOT NULL PRIMARY KEY,
+    "title" VARCHAR(255) NOT NULL,
+    "submitter" VARCHAR(255) NOT NULL,
+    "status" INTEGER NOT NULL,
+    "param_k" INTEGER NOT NULL,
+    "param_reference" VARCHAR(255) NOT NULL,
+    "workdir" VARCHAR(255) NOT NULL,
+    "data_file" VARCHAR(255) NOT NULL,
+    "input_file" VARCHAR(255) NOT NULL,
+    "output_file" VARCHAR(255) NOT NULL,
+    "log_file" VARCHAR(255) NOT NULL,
+    "q_file" VARCHAR(255) NOT NULL,
+    "created_at" DATETIME NOT NULL,
+    "updated_at" DATETIME NOT NULL)
+"""
+
+
+def test_create_tables_upgrades_baseline(database):
+    now = str(datetime.datetime.now())
+    with sqlite3.connect(database) as connection:
+        connection.execute(BASELINE_SCHEMA)
+        connection.execute(
+            "INSERT INTO job VALUES (1, 't', 'a', 2, 3, '', 'w', 'd', 'i', "
+            "'o', 'l', 'q', ?, ?)", (now, now))
+    create_tables()
+
+    columns = set(c.name for c in db.get_columns("job"))
+    assert {"batch_id", "priority", "engine", "data_hash"} <= columns
+    indexes = {i.name: i.columns for i in db.get_indexes("job")}
+    assert indexes["job_batch_id"] == ["batch_id"]
+    assert "job_status" not in indexes
+    assert set(db.get_tables()) >= {"batch", "job", "run", "jobstage"}
+    job = Job.get_by_id(1)
+    assert job.status == Job.Status.Complete
+    assert job.batch is None
+    # Nothing left to migrate on the next startup
+    create_tables()
+
+
+def test_import_without_numpy():
+    # Web workers import the models, numpy only loads with jobs or panels
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([
+        sys.executable, "-c",
+        "import sys, types; sys.modules.setdefault('uwsgidecorators', "
+        "types.SimpleNamespace(spool=lambda f: f)); "
+        "import wstr.db; print('numpy' in sys.modules)"
+    ], env=env)
+    assert output.strip() == b"False"
+
+
+def test_job_metrics_observed(database, tmp_path, monkeypatch):
+    for name in ["queue_time", "run_time", "stage_time"]:
+        histograms = getattr(models, name)
+        monkeypatch.setattr(histograms, "root", str(tmp_path / name))
+        histograms.clear()
+    create_tables()
+    job = Job.create(
+        submitter="a", workdir="w", data_file="d", input_file="i",
+        output_file="o", log_file="l", q_file="q")
+    job.update_status(Job.Status.Running)
+    job.update_status(Job.Status.Complete)
+    JobStage.save_all(job, [
+        Stage("parse", None, job.started_at, Usage(0.5, 0.4, 1, 0, 0))])
+    models.flush_metrics()
+    assert models.queue_time.collect()[""].count == 1
+    assert list(models.run_time.collect()) == ["Complete"]
+    assert models.stage_time.collect()["parse"].total == 0.5
+
+
+def test_spooler_processes(monkeypatch):
+    monkeypatch.setitem(sys.modules, "uwsgi", SimpleNamespace(
+        opt={"spooler-processes": b"6"}))
+    assert models.spooler_processes() == 6
+    monkeypatch.setitem(sys.modules, "uwsgi", SimpleNamespace(opt={}))
+    assert models.spooler_processes() == models.Config.N_SPOOLER
+
+
+def test_create_tables_drops_obsolete_indexes(database):
+    create_tables()
+    db.execute_sql('CREATE INDEX "job_status" ON "job" ("status")')
+    create_tables()
+    indexes = set(i.name for i in db.get_indexes("job"))
+    assert "job_status" not in indexes
+    assert "job_status_updated_at_id" in indexes
+
+
+def test_cursor():
+    cursor = (datetime.datetime(2024, 5, 1, 12, 30, 0, 5), 42)
+    assert models.decode_cursor(models.encode_cursor(cursor)) == cursor
+    assert models.encode_cursor(None) is None
+    for value in ["", "2024-05-01", "2024-05-01,x", "a,1"]:
+        with pytest.raises(ValueError):
+            models.decode_cursor(value)
+
+
+def make_job(**kwargs):
+    fields = dict(
+        submitter="a", workdir="w", data_file="d", input_file="i",
+        output_file="o", log_file="l", q_file="q")
+    fields.update(kwargs)
+    return Job.create(**fields)
+
+
+def test_claim_order(tables):
+    hours_ago = datetime.datetime.now() - datetime.timedelta(
+        seconds=models.Config.MAX_WAIT + 3600)
+    make_job(submitter="a").update_status(Job.Status.Running)
+    short = make_job(submitter="a", predicted_runtime=10)
+    b_long = make_job(submitter="b", predicted_runtime=100)
+    b_short = make_job(submitter="b", predicted_runtime=50)
+    high = make_job(
+        submitter="a", priority=Job.Priority.High, predicted_runtime=1000)
+    starved = make_job(
+        submitter="a", predicted_runtime=500, created_at=hours_ago)
+    low = make_job(submitter="b", priority=Job.Priority.Low)
+    # Priority, then the submitter running the fewest jobs, then jobs
+    # waiting for too long, then the shortest
+    claimed = [Job.claim() for _ in range(6)]
+    assert [job.id for job in claimed] == [
+        high.id, b_short.id, b_long.id, starved.id, short.id, low.id]
+    assert all(job.status == Job.Status.Running for job in claimed)
+    assert Job.claim() is None
+
+
+def test_cancel_kills_runs(tables):
+    job = make_job()
+    job.update_status(Job.Status.Running)
+    # Spoolers hold their own copy of the job while it runs
+    spooler_copy = Job.get_by_id(job.id)
+    proc = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    models.Run.create(
+        job=job, param_k=2, seed=1, workdir="w", output_file="o",
+        log_file="l", q_file="q", pid=proc.pid)
+    try:
+        Job.get_by_id(job.id).cancel()
+        assert proc.wait(timeout=10) == -models.signal.SIGTERM
+    finally:
+        proc.kill()
+    with pytest.raises(ProcessLookupError):
+        os.killpg(proc.pid, 0)
+    assert Job.get_by_id(job.id).status == Job.Status.Canceled
+
+    finished_at = Job.get_by_id(job.id).finished_at
+    spooler_copy.update_status(Job.Status.Complete)
+    assert spooler_copy.status == Job.Status.Canceled
+    assert Job.get_by_id(job.id).status == Job.Status.Canceled
+    assert Job.get_by_id(job.id).finished_at == finished_at
+    # Only jobs still queued or running can be canceled
+    done = make_job()
+    done.update_status(Job.Status.Complete)
+    assert done.cancel().status == Job.Status.Complete
+
+
+def test_cancel_observed_once(tables, tmp_path, monkeypatch):
+    monkeypatch.setattr(models.run_time, "root", str(tmp_path))
+    models.run_time.clear()
+    job = make_job()
+    job.update_status(Job.Status.Running)
+    spooler_copy = Job.get_by_id(job.id)
+    job.cancel()
+    # The spooler ends the job it held, without knowing it was canceled
+    spooler_copy.update_status(Job.Status.Failure)
+    models.flush_metrics()
+    histograms = models.run_time.collect()
+    assert list(histograms) == ["Canceled"]
+    assert histograms["Canceled"].count == 1
+
+
+def walk(limit, **filters):
+    jobs, cursor = Job.page(limit=limit, **filters)
+    pages = [jobs]
+    while cursor is not None:
+        jobs, cursor = Job.page(cursor=cursor, limit=limit, **filters)
+        pages.append(jobs)
+    return pages
+
+
+def test_page_ties_and_filters(tables):
+    start = datetime.datetime(2024, 5, 1)
+    batch = models.Batch.create(submitter="a")
+    jobs = [
+        make_job(submitter="ab"[i % 2], batch=batch if i < 6 else None)
+        for i in range(10)
+    ]
+    for job in jobs[:3]:
+        job.update_status(Job.Status.Complete)
+    # Bulk updates share their timestamp: only the ids tell them apart
+    for i, job in enumerate(jobs):
+        Job.update(
+            created_at=start,
+            updated_at=start + datetime.timedelta(seconds=i % 3)
+        ).where(Job.id == job.id).execute()
+    expected = [jobs[i] for i in [8, 5, 2, 7, 4, 1, 9, 6, 3, 0]]
+
+    pages = walk(3)
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    assert [job.id for page in pages for job in page] == \
+        [job.id for job in expected]
+
+    filters = [
+        dict(submitter="a"),
+        dict(status=Job.Status.Complete),
+        dict(batch=batch),
+        dict(submitter="b", batch=batch),
+        dict(submitter="a", status=Job.Status.Complete, batch=batch),
+        dict(submitter="b", status=Job.Status.Queued, batch=batch),
+    ]
+    for kwargs in filters:
+        matching = [
+            job.id for job in expected
+            if all(getattr(Job.get_by_id(job.id), name) == value
+                   for name, value in kwargs.items())
+        ]
+        ids = [job.id for page in walk(2, **kwargs) for job in page]
+        assert ids == matching
+        assert Job.count_since(**kwargs) == len(matching)
+    assert Job.count_since(since=start) == 0
+    assert Job.count_since(
+        since=start - datetime.timedelta(seconds=1), submitter="b") == 5
+    assert Job.page(since=start)[0] == []
+
+
+def test_changed_since_ties(tables):
+    start = datetime.datetime(2024, 5, 1)
+    jobs = [make_job() for _ in range(7)]
+    for i, job in enumerate(jobs):
+        Job.update(
+            updated_at=start + datetime.timedelta(seconds=i // 3)
+        ).where(Job.id == job.id).execute()
+    seen, cursor = [], (start - datetime.timedelta(seconds=1), None)
+    while True:
+        changed, next_cursor = Job.changed_since(*cursor, limit=2)
+        if len(changed) == 0:
+            assert next_cursor == (cursor[0], cursor[1] or 0)
+            break
+        seen.extend(job.id for job in changed)
+        cursor = next_cursor
+    assert seen == [job.id for job in jobs]
+    # A job updated after the cursor comes back, nothing else does
+    Job.update(updated_at=start + datetime.timedelta(seconds=5)) \
+        .where(Job.id == jobs[0].id).execute()
+    changed, _ = Job.changed_since(*cursor)
+    assert [job.id for job in changed] == [jobs[0].id]
@@ -0,0 +1,37 @@
+import gzip
+
+from flask import Flask
+from wstr.download import compress, send_artifact
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.add_url_rule("/file", "file", lambda: send_artifact(path, "text/plain"))
+    return app.test_client()
+
+
+def test_send_artifact(tmp_path):
+    path = tmp_path / "outputfile_f"
+    path.write_text("A" * 1000)
+    assert gzip.open(compress(str(path))).read() == b"A" * 1000
+    client = make_app(str(path))
+
+    plain = client.get("/file")
+    assert plain.data == b"A" * 1000
+    assert "Accept-Encoding" in plain.headers["Vary"]
+    assert client.get(
+        "/file", headers={"If-None-Match": plain.headers["ETag"]}
+    ).status_code == 304
+
+    packed = client.get("/file", headers={"Accept-Encoding": "gzip"})
+    assert packed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(packed.data) == plain.data
+
+    partial = client.get("/file", headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.data == b"A" * 10
+
+
+def test_send_missing_artifact(tmp_path):
+    client = make_app(str(tmp_path / "missing"))
+    assert client.get("/file").status_code == 404
@@ -1,7 +1,9 @@
 import pytest
+import numpy as np
 
 from io import StringIO
 from wstr import io
+from wstr.cache import genotype_digest
 
 EXPECTED = dict(
     X=dict(
@@ -156,6 +158,113 @@ class TestGenotype(object):
             assert geno == expected[sample]
 
 
+class TestGenotypeMatrix(object):
+    def test_create_empty(self):
+        genotype = io.GenotypeMatrix()
+        assert genotype.n_loci == 0
+        assert genotype.n_samples == 0
+
+    def test_add_unique_loci(self):
+        genotype = io.GenotypeMatrix()
+        genotype.add_loci(["C", "A"])
+        genotype.add_loci(["B", "A"])
+        assert list(genotype.loci) == ["A", "B", "C"]
+        assert genotype.matrix.shape == (0, 3, 2)
+
+    def test_get(self):
+        genotype = io.GenotypeMatrix.parse_file(iter(CSV_STREAM), 'csv')
+        assert genotype.get("X", "D") == ('1', '2')
+        assert genotype.get("Y", "D") == ('-9', '-9')
+        with pytest.raises(KeyError):
+            genotype.get("Z", "A")
+
+    def check_parsed(self, genotype):
+        assert genotype.n_loci == 5
+        assert genotype.n_samples == 2
+        for sample, genotype in genotype:
+            assert sample in EXPECTED
+            assert genotype == EXPECTED[sample]
+
+    def test_parse_str(self):
+        genotype = io.GenotypeMatrix.parse_file(iter(STR_STREAM), 'str')
+        self.check_parsed(genotype)
+
+    def test_parse_csv(self):
+        genotype = io.GenotypeMatrix.parse_file(iter(CSV_STREAM), 'csv')
+        self.check_parsed(genotype)
+
+    def test_parse_stream(self):
+        stream = StringIO("".join(STR_STREAM))
+        genotype = io.GenotypeMatrix.parse_file(stream, 'str')
+        self.check_parsed(genotype)
+
+    def test_parse_raises_error(self):
+        with pytest.raises(ValueError):
+            io.GenotypeMatrix.parse_file(iter(CSV_STREAM + ["Z,123\n"]), 'csv')
+        with pytest.raises(ValueError):
+            io.GenotypeMatrix.parse_file(
+                iter(STR_STREAM[:1] + ["X 1 1\n", "X 1 1\n"]), 'str')
+
+    def test_iter_blocks(self):
+        blocks = list(io.GenotypeMatrix.iter_blocks(
+            iter(CSV_STREAM), 'csv', block_size=1))
+        assert [block.samples for block in blocks] == [["X"], ["Y"]]
+        merged = io.GenotypeMatrix()
+        for block in blocks:
+            merged.merge(block)
+        self.check_parsed(merged)
+
+    def test_write(self):
+        genotype = io.GenotypeMatrix.parse_file(iter(TSV_STREAM), 'tsv')
+        stream = StringIO("")
+        genotype.write(stream)
+        assert stream.getvalue() == "".join(STR_STREAM)
+
+    def test_write_one_row_per_ind(self):
+        expected = [
+            " A B C D E\n",
+            "X 1 1 1 1 2 2 1 2 -9 -9\n",
+            "Y 2 2 1 1 1 2 -9 -9 1 2\n"
+        ]
+        for cls in (io.Genotype, io.GenotypeMatrix):
+            genotype = cls.parse_file(iter(CSV_STREAM), 'csv')
+            stream = StringIO("")
+            genotype.write(stream, one_row_per_ind=True)
+            assert stream.getvalue() == "".join(expected)
+
+    def test_merge_genotype_raises_error(self):
+        genotype = io.GenotypeMatrix()
+        with pytest.raises(ValueError):
+            genotype.merge(1)
+
+    def test_combine(self):
+        one = io.GenotypeMatrix()
+        one.add('X', ['A', 'B', 'C'], [('1', '1'), ('1', '2'), ('2', '2')])
+        other = io.GenotypeMatrix()
+        other.add('Y', ['A', 'D', 'E'], [('3', '1'), ('1', '2'), ('2', '2')])
+
+        merged = io.GenotypeMatrix.combine(one, other)
+        assert one.n_loci == 3 and other.n_loci == 3
+        assert merged.n_loci == 5
+        assert merged.n_samples == 2
+        assert merged.get('X', 'B') == ('1', '2')
+        assert merged.get('X', 'E') == ('-9', '-9')
+        assert merged.get('Y', 'A') == ('3', '1')
+        assert merged.alleles('A') == ['1', '3']
+
+    def test_combine_with_genotype(self):
+        one = io.Genotype.parse_file(iter(STR_STREAM), 'str')
+        merged = io.GenotypeMatrix.combine(one, io.GenotypeMatrix())
+        self.check_parsed(merged)
+
+    def test_promote_dtype(self):
+        genotype = io.GenotypeMatrix()
+        for i in range(200):
+            genotype.add("S%d" % i, ["A"], [(str(i), str(i + 1))])
+        assert genotype.get("S199", "A") == ('199', '200')
+        assert genotype.matrix.dtype == np.int16
+
+
 class TestReference(object):
     def test_create_empty(self):
         reference = io.Reference(io.Genotype(), [], [])
@@ -163,6 +272,7 @@ class TestReference(object):
         assert reference.genotype.n_samples == 0
         assert reference.groups == []
         assert reference.ranges == []
+        assert reference.index.n_loci == 0
 
     def test_limit_range(self):
         genotype = io.Genotype.parse_str(iter(STR_STREAM))
@@ -173,6 +283,123 @@ class TestReference(object):
         assert reference.groups == groups
         assert reference.ranges == ranges
 
+    def test_save_load(self, tmp_path):
+        genotype = io.GenotypeMatrix.parse_str(iter(STR_STREAM))
+        path = str(tmp_path / "panel")
+        io.Reference(genotype, ["A", "B"], [1, 1]).save(path)
+        assert io.Reference.is_compiled(path)
+
+        reference = io.Reference.load(path)
+        assert reference.groups == ["A", "B"]
+        assert reference.ranges == [(0, 1), (1, 2)]
+        assert not reference.genotype.matrix.flags.writeable
+        assert np.array_equal(
+            reference.index.counts,
+            io.AlleleIndex.build(genotype, reference.ranges).counts)
+        for sample, geno in reference.genotype:
+            assert geno == EXPECTED[sample]
+        # Merging must copy rather than write into the mapped panel
+        merged = io.GenotypeMatrix.combine(reference.genotype, genotype)
+        assert merged.n_samples == 4
+
+
+class TestAlleleIndex(object):
+    def test_build(self):
+        genotype = io.Genotype.parse_str(iter(STR_STREAM))
+        index = io.AlleleIndex.build(genotype, [(0, 1), (1, 2)])
+        assert index.loci == ["A", "B", "C", "D", "E"]
+        assert index.column(["C", "Z", "A"]).tolist() == [2, -1, 0]
+        assert index.n_unknown(["A", "Z"]) == 1
+        assert index.alleles("A") == ["1", "2"]
+        assert index.counts[0].tolist() == [[2, 0], [0, 2]]
+        assert index.totals[3].tolist() == [2, 0]
+        assert index.missing_rate[4].tolist() == [1.0, 0.0]
+
+    def test_frequencies(self):
+        genotype = io.Genotype.parse_str(iter(STR_STREAM))
+        index = io.AlleleIndex.build(genotype, [(0, 1), (1, 2)])
+        freqs = index.frequencies(pseudocount=0.5)
+        # Known alleles of each locus, then the "other allele" slot
+        assert np.allclose(freqs.sum(axis=1), 1)
+        assert np.allclose(freqs[0, :, 0], [2.5 / 3.5, 0.5 / 3.5, 0.5 / 3.5])
+        assert np.allclose(freqs[1, :, 0], [2.5 / 3, 0.5 / 3, 0])
+        assert index.frequencies(pseudocount=0.5) is freqs
+
+    def test_translate(self):
+        genotype = io.Genotype.parse_str(iter(STR_STREAM))
+        index = io.AlleleIndex.build(genotype, [(0, 2)])
+        data = io.GenotypeMatrix.parse_delim(iter([
+            "S,C,Z,A\n",
+            "U,21,11,13\n",
+            "V,,12,22\n",
+        ]), ",")
+        columns, matrix = index.translate(data)
+        assert columns.tolist() == [0, 2]
+        # "3" is unknown to the panel, "C" is coded as "2", "1" there
+        assert matrix.tolist() == [
+            [[0, 2], [0, 1]],
+            [[1, 1], [-1, -1]],
+        ]
+
+
+class TestValidate(object):
+    def test_valid(self):
+        for stream, format in [(STR_STREAM, "str"), (CSV_STREAM, "csv"),
+                               (TSV_STREAM, "tsv")]:
+            report = io.validate(iter(stream), format)
+            assert report.ok
+            assert (report.n_samples, report.n_loci) == (2, 5)
+
+    def test_digest(self):
+        # Normalized: format, line endings and locus order don't matter
+        reordered = ["S,E,D,C,B,A\r\n", "X,,12,22,11,11\r\n",
+                     "Y,12,,12,11,22\r\n"]
+        digests = set(
+            io.validate(iter(stream), format).digest
+            for stream, format in [(STR_STREAM, "str"), (CSV_STREAM, "csv"),
+                                   (TSV_STREAM, "tsv"), (reordered, "csv")])
+        genotype = io.GenotypeMatrix.parse_file(iter(STR_STREAM), "str")
+        assert digests == {genotype_digest(genotype)}
+        stream = CSV_STREAM[:2] + ["Y,22,11,12,,11\n"]
+        assert io.validate(iter(stream), "csv").digest not in digests
+        assert io.validate(iter(CSV_STREAM + ["Z\n"]), "csv").digest is None
+
+    def test_errors(self):
+        stream = CSV_STREAM + ["X,11,1,22,12,11\n", "Z,11,11\n"]
+        report = io.validate(iter(stream), "csv")
+        assert [tuple(issue) for issue in report.errors] == [
+            (4, 1, "Duplicate sample `X`, first on line 2"),
+            (4, 3, "Invalid genotype `1`"),
+            (5, None, "Expected 5 genotypes, found 2"),
+        ]
+        assert report.n_samples == 3
+
+    def test_str_errors(self):
+        report = io.validate(iter(STR_STREAM + ["Z 1 1 2 1 1\n"]), "str")
+        assert [tuple(issue) for issue in report.errors] == [
+            (6, None, "Missing second line of sample")]
+        report = io.validate(iter(STR_STREAM[:2] + ["Y 1 1 A 1 1\n"]), "str")
+        assert report.errors[0].message == "Sample name differs from line 2"
+
+    def test_warnings(self):
+        report = io.validate(
+            iter(TSV_STREAM), "tsv", loci={"A", "B", "C", "D"},
+            max_missing_sample=0.1, max_missing_locus=0.4)
+        assert report.ok
+        assert [tuple(issue) for issue in report.warnings] == [
+            (1, 5, "Locus `D` is missing in 50% of the samples"),
+            (1, 6, "Locus `E` isn't part of the reference panel"),
+            (1, 6, "Locus `E` is missing in 50% of the samples"),
+            (2, None, "Sample `X` is missing 20% of its genotypes"),
+            (3, None, "Sample `Y` is missing 20% of its genotypes"),
+        ]
+
+    def test_capped(self):
+        stream = [CSV_STREAM[0]] + ["S%d,1,1,1,1,1\n" % i for i in range(10)]
+        report = io.validate(iter(stream), "csv", max_issues=3)
+        assert len(report.errors) == 3
+        assert report.n_errors == 50
+
 
 class TestQFile(object):
     def test_create_empty(self):
@@ -237,3 +464,28 @@ class TestQFile(object):
         assert qfile.get_ancestry(0) == [1, 1, 1, 1]
         assert qfile.get_ancestry(1) == [1, 1, 1, 1]
         assert qfile.get_ancestry(2) == [1, 1, 1, 1]
+
+    def test_summarise_median(self):
+        qfile = io.QFile.from_arrays(
+            ["A", "B", "C", "D"], [[1, 0], [0, 1], [0, 1], [0.2, 0.8]])
+        qfile = qfile.summarise(["G"], [(0, 3)], func="median")
+        assert qfile.samples == ["D", "G"]
+        assert qfile.get_ancestry(0) == [0.2, 0]
+        with pytest.raises(ValueError):
+            qfile.summarise(["G"], [(0, 1)], func="invalid")
+
+    def test_slicing(self):
+        qfile = io.QFile.from_arrays(
+            ["A", "B", "C"], [[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+        assert qfile.row(1).tolist() == [4, 5, 6]
+        sliced = qfile[1:, :2]
+        assert sliced.samples == ["B", "C"]
+        assert sliced.n_ancestries == 2
+        assert sliced.get_ancestry(1) == [5, 8]
+        assert qfile[-1].samples == ["C"]
+
+    def test_open(self):
+        stream = StringIO("A\t0.25\t0.75\nB\t1\t0\n")
+        qfile = io.QFile.open(stream)
+        assert qfile.samples == ["A", "B"]
+        assert qfile.get_ancestry(1) == [0.75, 0]
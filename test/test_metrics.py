@@ -0,0 +1,46 @@
+import os
+import json
+
+from wstr.metrics import Histogram, ProcessHistograms
+from wstr.metrics import format_metric, histogram_samples
+
+
+def test_histogram():
+    histogram = Histogram([1, 5])
+    for value in [0.5, 1, 3, 10]:
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.cumulative() == [2, 3]
+    assert histogram.count == 4
+    assert histogram.total == 14.5
+
+
+def test_format():
+    text = format_metric("jobs", "gauge", "Jobs.", [
+        ("", [("status", 'a"b')], 3),
+        ("", [], 0.5),
+    ])
+    assert text == ('# HELP jobs Jobs.\n# TYPE jobs gauge\n'
+                    'jobs{status="a\\"b"} 3\njobs 0.5\n')
+    text = format_metric("t", "histogram", "T.", histogram_samples(
+        [("view", "home")], [1, 5], [2, 3], 4, 14.5))
+    assert 't_bucket{view="home",le="1.0"} 2\n' in text
+    assert 't_bucket{view="home",le="+Inf"} 4\n' in text
+    assert 't_sum{view="home"} 14.5\n' in text
+    assert 't_count{view="home"} 4\n' in text
+
+
+def test_process_histograms(tmpdir):
+    root = str(tmpdir)
+    other = dict(home=dict(counts=[1, 0, 0], total=0.5))
+    with open(os.path.join(root, "1.json"), "w") as stream:
+        json.dump(other, stream)
+    histograms = ProcessHistograms(root, [1, 5], interval=60)
+    histograms.observe("home", 2)
+    histograms.observe("view", 7)
+    collected = histograms.collect()
+    assert collected["home"].counts == [1, 1, 0]
+    assert collected["home"].total == 2.5
+    assert collected["view"].counts == [0, 0, 1]
+    histograms.clear()
+    assert os.listdir(root) == []
@@ -0,0 +1,34 @@
+import numpy as np
+
+from wstr.predict import RuntimePredictor, run_load, MIN_HISTORY
+
+
+def test_run_load():
+    assert run_load([3], 1, 4) == 3
+    assert run_load([2, 3], 4, 4) == 20 / 4
+    assert run_load([2, 3], 1, 4) == 5 / 2
+
+
+def test_unfitted():
+    predictor = RuntimePredictor()
+    assert not predictor.fitted
+    assert predictor.predict(100, 50, 3) is None
+    assert not predictor.fit([], [], [], []).fitted
+
+
+def test_ratio_fallback():
+    predictor = RuntimePredictor().fit([100, 200], [10, 10], [1, 1], [10, 20])
+    assert predictor.fitted
+    assert predictor.predict(300, 10, 2) == 60
+
+
+def test_fit_log_linear():
+    rng = np.random.RandomState(0)
+    n_samples = rng.randint(10, 5000, size=50)
+    n_loci = rng.randint(10, 200, size=50)
+    loads = rng.randint(1, 12, size=50)
+    durations = 1e-4 * n_samples * n_loci ** 0.9 * loads
+    predictor = RuntimePredictor().fit(n_samples, n_loci, loads, durations)
+    assert predictor.n_jobs == 50 >= MIN_HISTORY
+    expected = 1e-4 * 1000 * 100 ** 0.9 * 6
+    assert np.isclose(predictor.predict(1000, 100, 6), expected)
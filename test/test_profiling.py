@@ -0,0 +1,31 @@
+import os
+import pstats
+import tracemalloc
+
+from wstr.profiling import Profiler
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(1000)]
+
+
+def test_profiler(tmpdir):
+    prof_file = str(tmpdir.join("job.prof"))
+    alloc_file = str(tmpdir.join("alloc.txt"))
+    with Profiler(prof_file, alloc_file) as profiler:
+        data = allocate()
+        profiler.checkpoint()
+        del data
+    assert not tracemalloc.is_tracing()
+    stats = pstats.Stats(prof_file).stats
+    assert any(func[2] == "allocate" for func in stats)
+    report = open(alloc_file).read()
+    assert report.startswith("Peak traced memory")
+    assert "bytearray(1024)" in report
+
+
+def test_disabled(tmpdir):
+    prof_file = str(tmpdir.join("job.prof"))
+    with Profiler(prof_file, str(tmpdir.join("a")), enabled=False) as p:
+        p.checkpoint()
+    assert not os.path.exists(prof_file)
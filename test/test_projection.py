@@ -0,0 +1,61 @@
+import io
+import numpy as np
+
+from wstr.io import AlleleIndex, GenotypeMatrix, QFile
+from wstr.projection import project, write_output
+
+
+def simulate(q, freqs, rng):
+    # Biallelic genotypes of samples with ancestry `q`, as allele codes
+    n_loci = freqs.shape[0]
+    origin = np.array([
+        rng.choice(len(row), size=(n_loci, 2), p=row) for row in q])
+    p = freqs[np.arange(n_loci)[:, np.newaxis], origin]
+    return (rng.random_sample(p.shape) >= p).astype(np.int8)
+
+
+def panel(rng, n_ref=60, n_loci=300):
+    freqs = rng.beta(0.5, 0.5, size=(n_loci, 3))
+    groups = np.repeat(np.eye(3), n_ref, axis=0)
+    return freqs, groups, [(i * n_ref, (i + 1) * n_ref) for i in range(3)]
+
+
+def genotype(matrix):
+    n_samples, n_loci, _ = matrix.shape
+    return GenotypeMatrix.from_arrays(
+        ["S%03d" % i for i in range(n_samples)],
+        ["L%03d" % j for j in range(n_loci)],
+        [["1", "2"]] * n_loci, matrix)
+
+
+def test_project():
+    rng = np.random.RandomState(0)
+    freqs, reference, ranges = panel(rng)
+    q = np.array([[1, 0, 0], [0.5, 0.5, 0], [0.2, 0.3, 0.5], [0, 0, 1]])
+    index = AlleleIndex.build(
+        genotype(simulate(reference, freqs, rng)), ranges)
+    matrix = simulate(q, freqs, rng)
+    matrix[-1, :50] = -1  # Missing genotypes
+    projection = project(genotype(matrix), index)
+    samples = projection.q
+    assert np.allclose(samples.sum(axis=1), 1)
+    assert np.abs(samples - q).max() < 0.15
+    assert samples[0, 1:].max() < 0.05
+    assert np.isclose(projection.missing[-1], 50 / 300)
+    assert projection.n_loci == 300
+    assert projection.em_iter == 5 and projection.newton_iter > 0
+
+
+def test_write_output():
+    rng = np.random.RandomState(1)
+    freqs, reference, ranges = panel(rng, n_ref=10, n_loci=50)
+    data = genotype(simulate(reference, freqs, rng))
+    projection = project(data, AlleleIndex.build(data, ranges))
+    stream = io.StringIO()
+    write_output(stream, data.samples, projection, ["A", "B", "C"])
+    assert "Newton iterations: %d\n" % projection.newton_iter \
+        in stream.getvalue()
+    stream.seek(0)
+    qfile = QFile.parse(stream)
+    assert qfile.samples == data.samples
+    assert np.allclose(qfile.matrix, projection.q, atol=1e-3)
@@ -0,0 +1,45 @@
+import os
+import time
+import threading
+
+from wstr.stages import StageRecorder, exit_code
+
+
+def test_exit_code():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(3)
+    _, status, rusage = os.wait4(pid, 0)
+    assert exit_code(status) == 3
+    assert rusage.ru_utime >= 0
+
+
+def test_measure():
+    recorder = StageRecorder()
+    with recorder.measure("sleep"):
+        time.sleep(0.05)
+    with recorder.measure("spin", run=1):
+        end = time.process_time() + 0.05
+        while time.process_time() < end:
+            pass
+    sleep, spin = recorder.stages
+    assert (sleep.name, sleep.run) == ("sleep", None)
+    assert (spin.name, spin.run) == ("spin", 1)
+    assert sleep.usage.wall_time >= 0.05
+    assert sleep.usage.cpu_time < sleep.usage.wall_time
+    assert spin.usage.cpu_time > 0
+    assert spin.usage.max_rss > 0
+
+
+def test_threads():
+    recorder = StageRecorder()
+
+    def work(i):
+        with recorder.measure("work", run=i):
+            pass
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(s.run for s in recorder.stages) == list(range(8))
@@ -0,0 +1,24 @@
+from wstr import startup
+
+IMPORTTIME_LOG = [
+    "import time: self [us] | cumulative | imported package\n",
+    "import time:       100 |        100 |     numpy.core\n",
+    "import time:       400 |        500 |   numpy\n",
+    "import time:       200 |        700 | wstr\n",
+    "import time:        50 |         50 | json\n",
+    "Traceback (most recent call last):\n",
+]
+
+
+def test_parse_importtime():
+    timings = startup.parse_importtime(IMPORTTIME_LOG)
+    assert [t.module for t in timings] == ["numpy.core", "numpy", "wstr", "json"]
+    assert [t.depth for t in timings] == [2, 1, 0, 0]
+    assert abs(startup.total_time(timings) - 0.00075) < 1e-9
+
+
+def test_by_package():
+    timings = startup.parse_importtime(IMPORTTIME_LOG)
+    packages = startup.by_package(timings)
+    assert packages[0][0] == "numpy"
+    assert abs(packages[0][1] - 0.0005) < 1e-9
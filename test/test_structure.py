@@ -0,0 +1,58 @@
+from wstr import structure
+
+MAINPARAMS = [
+    "Data file format\n",
+    "#define NUMINDS    759    // (int) number of diploid individuals\n",
+    "#define ONEROWPERIND 0    // (B) store data for individuals in a single line\n",
+]
+
+
+def test_write_params(tmp_path):
+    source = tmp_path / "mainparams"
+    source.write_text("".join(MAINPARAMS))
+    dest = structure.write_params(
+        str(source), str(tmp_path / "params"), ONEROWPERIND=1)
+
+    lines = open(dest).readlines()
+    assert lines[:2] == MAINPARAMS[:2]
+    assert lines[2] == \
+        "#define ONEROWPERIND 1    // (B) store data for individuals in a single line\n"
+    assert structure.read_params(dest) == dict(NUMINDS="759", ONEROWPERIND="1")
+
+
+def test_parse_likelihood():
+    stream = iter([
+        "Run parameters:\n",
+        "Estimated Ln Prob of Data   = -1234.5\n",
+        "Mean value of ln likelihood = -1200.1\n",
+    ])
+    assert structure.parse_likelihood(stream) == -1234.5
+
+
+def test_structure_command():
+    cmd = structure.structure_command(
+        "structure", "mainparams", "extraparams", 3, 62, 23,
+        "inputfile", "outputfile_f", seed=7)
+    assert cmd[cmd.index("-o") + 1] == "outputfile"
+    assert cmd[-2:] == ["-D", "7"]
+
+
+def test_evanno():
+    likelihoods = {
+        1: [-1000.0, -1002.0],
+        2: [-900.0, -904.0],
+        3: [-880.0, -884.0],
+        4: [-875.0, -881.0],
+    }
+    table = structure.evanno(likelihoods)
+    assert table[1]["delta_k"] is None and table[4]["delta_k"] is None
+    assert table[2]["mean"] == -902.0
+    # mean |L(3) - 2 L(2) + L(1)| = (80 + 78) / 2, sd(L(2)) = 2.83
+    assert abs(table[2]["delta_k"] - 79 / 2 ** 1.5) < 1e-9
+    assert structure.best_k(table) == 2
+
+
+def test_best_k_without_replicates():
+    table = structure.evanno({1: [-1000.0], 2: [-900.0], 3: [-950.0]})
+    assert all(row["delta_k"] is None for row in table.values())
+    assert structure.best_k(table) == 2
@@ -0,0 +1,52 @@
+import pytest
+from werkzeug.exceptions import RequestEntityTooLarge
+from wstr.upload import Sniffer, UploadSink, ingest
+
+DATA = b"ID\tL1\tL2\nA1\tAC\tGG\r\nA2\t-9\tAG\n"
+
+
+def sniff(format, data, chunk_size=4):
+    sniffer = Sniffer(format)
+    for i in range(0, len(data), chunk_size):
+        sniffer.feed(data[i:i + chunk_size])
+    sniffer.close()
+    return sniffer
+
+
+def test_sniffer():
+    sniffer = sniff("txt", DATA)
+    assert sniffer.error is None
+    assert (sniffer.n_loci, sniffer.n_lines) == (2, 2)
+    assert sniffer.delimiter == b"\t"
+
+    assert sniff("csv", DATA).error == "Header isn't delimited by ','"
+    assert sniff("txt", DATA + b"A3\tAA\n").error == \
+        "Line 4 has 2 fields, expected 3"
+    assert sniff("txt", b"").error == "Empty file"
+    assert sniff("str", b"L1 L2\nA1 1 2\nA1 1 1\n").error is None
+    assert sniff("str", b"L1 L2\nA1 1 2\n").error == \
+        "Expected two lines per sample"
+
+
+def test_upload_sink(tmp_path):
+    sink = UploadSink("demo.txt", 1024, root=str(tmp_path))
+    for i in range(0, len(DATA), 5):
+        sink.write(DATA[i:i + 5])
+    assert sink.error is None
+    dest = sink.move(str(tmp_path / "demo.txt"))
+    assert open(dest, "rb").read() == DATA
+    sink.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["demo.txt"]
+
+
+def test_upload_limit(tmp_path):
+    sink = UploadSink("demo.txt", 10, root=str(tmp_path))
+    with pytest.raises(RequestEntityTooLarge):
+        sink.write(DATA)
+    assert list(tmp_path.iterdir()) == []
+
+    with open(str(tmp_path / "source"), "wb") as stream:
+        stream.write(DATA)
+    with pytest.raises(ValueError):
+        ingest(open(str(tmp_path / "source"), "rb"), "demo.txt", 10,
+               root=str(tmp_path))
@@ -0,0 +1,56 @@
+import io
+import os
+
+from wstr.config import Config
+from wstr.db import Job
+
+DEMO = os.path.join(Config.RESOURCE, "demo.txt")
+
+
+def submit(client, priority, headers=None):
+    with open(DEMO, "rb") as stream:
+        data = stream.read()
+    return client.post("/add", headers=headers, data=dict(
+        name="t", submitter="a", ref_panel="", n_pops="2", n_reps="1",
+        seed="", priority=priority, engine="Structure",
+        datafile=(io.BytesIO(data), "demo.txt")),
+        content_type="multipart/form-data")
+
+
+def test_high_priority_needs_token(client, monkeypatch):
+    assert b'value="High"' not in client.get("/add").data
+    response = submit(client, "High")
+    assert b"Invalid priority" in response.data
+    assert Job.select().count() == 0
+    # Without a configured token, nobody gets it
+    response = submit(client, "High", {"X-Admin-Token": ""})
+    assert Job.select().count() == 0
+
+    monkeypatch.setattr(Config, "ADMIN_TOKEN", "secret")
+    response = submit(client, "High", {"X-Admin-Token": "wrong"})
+    assert b"Invalid priority" in response.data
+    assert b'value="High"' in client.get(
+        "/add", headers={"X-Admin-Token": "secret"}).data
+    response = submit(client, "High", {"X-Admin-Token": "secret"})
+    assert response.status_code == 302
+    assert Job.get().priority == Job.Priority.High
+    assert submit(client, "Low").status_code == 302
+
+
+def test_validation_read_once(client, monkeypatch):
+    submit(client, "Normal")
+    job = Job.get()
+    calls = []
+    validation = Job.validation
+
+    def counted(self):
+        calls.append(self.id)
+        return validation(self)
+    monkeypatch.setattr(Job, "validation", counted)
+    for _ in range(3):
+        assert client.get("/view/%d" % job.id).status_code == 200
+    assert calls == [job.id]
+    # A new report is read again
+    os.utime(job.validation_file, (0, 0))
+    client.get("/view/%d" % job.id)
+    assert calls == [job.id, job.id]